@@ -6,8 +6,12 @@ import gymnasium as gym
 from gymnasium import spaces
 import mujoco
 import glfw
-from collections import deque
-import leg.model
+from collections import OrderedDict
+import leg.table
+from rl import randomization
+from rl import terrain
+from rl import recorder
+from rl import renderer
 import itertools
 from multiprocessing import shared_memory
 
@@ -65,6 +69,15 @@ class Env(gym.Env):
         self.sub_indices = None
         self.del_indices_front = None
         self.del_indices_rear = None
+        # Compiled models by leg combination, least recently used first
+        self.model_cache = OrderedDict()
+        self.model_cache_size = 16
+        self.model = None
+        self.data = None
+        self.data_reuse = True  # False allocates MjData on every reset
+        self.terrain_bank = None
+        # Terrain and scale last written into the hfield of each model
+        self.hfield_terrains = {}
 
         # Design
         legs = np.array(np.load(
@@ -94,11 +107,7 @@ class Env(gym.Env):
                 i += 1
         self.leg_combs = np.array(self.leg_combs)
 
-        self.leg_mj_params = {}
-        for leg_index in self.leg_indices:
-            self.leg_mj_params[leg_index] = leg.model.mj_params(
-                self.leg_shapes[leg_index], self.leg_params[leg_index]
-            )
+        self.leg_mj_params = leg.table.MjParamsTable()
 
         # Obs
         self.obs_max = 3
@@ -130,6 +139,15 @@ class Env(gym.Env):
 
         # Reward
         self.reward_max = 3
+        self.reward_names = [
+            'v',
+            'dz', 'da',
+            'ny', 'qhd', 'qkol', 'col',
+            'tau', 'p',
+            'total'
+        ]
+        self.reward_history = None
+        self.contact_classes = ['self', 'other_floor', 'foot_floor']
 
         # Curriculum
         self.curriculum_x_max = 1
@@ -146,6 +164,15 @@ class Env(gym.Env):
             -1 / self.reward_v_tau * (0.1**2 + 0.1**2)
         )
 
+        # States recorded each step, enabled with record_states
+        self.state_fields = [
+            ('t', 1), ('cmd', 2),
+            ('q', 8), ('dq', 8), ('g', 3), ('w', 3), ('a', 8),
+            ('pos', 3), ('v', 3), ('tau', 8),
+            ('w_robot', 3)
+        ]
+        self.recorder = None
+
         # Render
         assert (
             render_mode is None or
@@ -154,6 +181,10 @@ class Env(gym.Env):
         self.render_mode = render_mode
         self.metadata['render_fps'] = 1 / self.timestep
         self.window = None
+        self.renderer = None
+        # Offscreen GL backend of rgb_array, egl or osmesa for headless
+        # rendering, see rl.renderer
+        self.render_backend = None
         self.viewport = mujoco.MjrRect(0, 0, 1280, 720)
         self.fps_step_count = 0
         self.cam = mujoco.MjvCamera()
@@ -175,7 +206,18 @@ class Env(gym.Env):
 
         # Buffers
         self.step_count = 0
-        self.rewards = []
+        # Reward terms of each step, written at the step count
+        if (
+            self.reward_history is None or
+            len(self.reward_history) < self.max_steps
+        ):
+            self.reward_history = np.zeros(
+                (self.max_steps, len(self.reward_names))
+            )
+        self.reward_sums = np.zeros(len(self.reward_names))
+        if self.recorder is not None:
+            self.recorder.reset()
+        self.contact_counts = np.zeros(len(self.contact_classes), dtype=int)
         self.last_dq = np.zeros(8)
         self.last_a = np.zeros(8)
         self.qh_history = np.zeros((100, 4))
@@ -340,88 +382,68 @@ class Env(gym.Env):
             self._model_params['body_yaw'] = self.np_random.uniform(-180, 180)
 
         # Domain randomization
-        for k, v in self._model_params.items():
-            if not isinstance(v, np.ndarray):
-                continue
-            self._model_params[k] = self.np_random.uniform(v[0], v[1])
+        self._model_params = randomization.sample(
+            self._model_params, self.np_random
+        )
 
-        # Create model
-        if self.sub_indices is None:
-            for k, v in self._model_params.items():
-                # Pad keys
-                self.model_string = re.sub(
-                    r'\b%s\b' % k, f'{k:30}',
-                    self.model_string
-                )
-            self.sub_indices = []
-            for k, v in self._model_params.items():
-                # Record indices
-                self.sub_indices.append([
-                    m.start()
-                    for m in re.finditer(r'\b%s\b' % k, self.model_string)
-                ])
-        if self.del_indices_front is None:
-            self.del_indices_front = [
-                [m.start(), m.end()]
-                for m in re.finditer(
-                    r'<body name=\"ps_f.\">[\s\S]*?</body>[\s\S]*?</body>',
-                    self.model_string
-                )
-            ]
-            self.del_indices_front += [
-                [m.start(), m.end()]
-                for m in re.finditer(
-                    r'<connect name=\"input_ps_coupler_f.\"[\s\S]*?>',
-                    self.model_string
-                )
-            ]
-        if self.del_indices_rear is None:
-            self.del_indices_rear = [
-                [m.start(), m.end()]
-                for m in re.finditer(
-                    r'<body name=\"ps_r.\">[\s\S]*?</body>[\s\S]*?</body>',
-                    self.model_string
-                )
-            ]
-            self.del_indices_rear += [
-                [m.start(), m.end()]
-                for m in re.finditer(
-                    r'<connect name=\"input_ps_coupler_r.\"[\s\S]*?>',
-                    self.model_string
-                )
-            ]
-        model_string = list(self.model_string)
-        for (k, v), indices in zip(self._model_params.items(), self.sub_indices):
-            for i in indices:
-                model_string[i:i + 30] = f'{str(v):30}'
-        if self.leg_param_front[3] == 0:
-            # Remove ps related bodies
-            for indices in self.del_indices_front:
-                model_string[indices[0]:indices[1]] = (
-                    ' ' * (indices[1] - indices[0])
-                )
-        if self.leg_param_rear[3] == 0:
-            # Remove ps related bodies
-            for indices in self.del_indices_rear:
-                model_string[indices[0]:indices[1]] = (
-                    ' ' * (indices[1] - indices[0])
-                )
-        model_string = ''.join(model_string)
-        self.model = mujoco.MjModel.from_xml_string(model_string, {})
-        self.data = mujoco.MjData(self.model)
+        # Create model. XML is only compiled for a new leg combination, and
+        # the per episode values are written into the compiled model.
+        model_key = (
+            self.leg_index,
+            self.leg_param_front[3] != 0,
+            self.leg_param_rear[3] != 0
+        )
+        if model_key in self.model_cache:
+            self.model_cache.move_to_end(model_key)
+        else:
+            model = self._compile_model()
+            self.hfield_terrains[model_key] = None
+            self.model_cache[model_key] = (
+                model, randomization.Randomizer(model)
+            )
+            if len(self.model_cache) > self.model_cache_size:
+                self.model_cache.popitem(last=False)
+        model, randomizer = self.model_cache[model_key]
+        if model is not self.model or not self.data_reuse:
+            self.model = model
+            self.data = mujoco.MjData(self.model)
+            self._resolve_addresses()
+        randomizer(self._model_params, self.data)
+        # The body pose is in qpos0, and qvel is zeroed
+        mujoco.mj_resetData(self.model, self.data)
         self.floor_id = self.data.geom('floor').id
         self.foot_ids = [
             self.model.geom(f'foot_{l}').id
             for l in ['fl', 'fr', 'rl', 'rr']
         ]
-
-        # Populate hfield
-        hfield_shape = self.model.hfield("floor").data.shape
-        hfield_size = self.model.hfield("floor").size
-        map = self.np_random.uniform(0, 1, hfield_shape)
-        self.model.hfield("floor").data = (
-            map * self.hfield_elevation / hfield_size[2]
+        # Class of each geom to classify contacts
+        self.geom_floor = np.zeros(self.model.ngeom, dtype=bool)
+        self.geom_floor[self.floor_id] = True
+        self.geom_foot = np.zeros(self.model.ngeom, dtype=bool)
+        self.geom_foot[self.foot_ids] = True
+
+        # Populate hfield from the terrain bank
+        hfield = self.model.hfield('floor')
+        if (
+            self.terrain_bank is None or
+            self.terrain_bank.maps.shape[1:] != hfield.data.shape
+        ):
+            self.terrain_bank = terrain.TerrainBank(hfield.data.shape)
+        if options and 'terrain_id' in options:
+            self.terrain_id = tuple(options['terrain_id'])
+        else:
+            self.terrain_id = self.terrain_bank.sample(self.np_random)
+        hfield_terrain = (
+            self.terrain_id, self.hfield_elevation / hfield.size[2]
         )
+        # Only a changed hfield is written, and uploaded when rendering
+        self.hfield_changed = (
+            self.hfield_terrains[model_key] != hfield_terrain
+        )
+        if self.hfield_changed:
+            self.terrain_bank.write(hfield.data, *hfield_terrain)
+            self.hfield_terrains[model_key] = hfield_terrain
+        self.hfield_terrain = hfield_terrain
 
         # Velocity
         if options and 'vx_cmd' in options:
@@ -448,6 +470,7 @@ class Env(gym.Env):
             self.latency_min, self.latency_max
         )
 
+        self._update_state()
         observation = self._get_obs()
         info = self._get_info()
 
@@ -468,8 +491,8 @@ class Env(gym.Env):
         torque += np.linalg.norm(torque) * self.np_random.uniform(
             -self.ft_noise_max_scale, self.ft_noise_max_scale, 3
         )
-        robot_mat = self._get_robot_tf()[:3, :3]
-        self.data.xfrc_applied[self.data.body('body').id] = np.array(
+        robot_mat = self.state['robot_tf'][:3, :3]
+        self.data.xfrc_applied[self.body_id] = np.array(
             [*robot_mat @ force, *robot_mat @ torque]
         )
 
@@ -481,6 +504,8 @@ class Env(gym.Env):
             warned = False
         except ValueError:
             warned = True
+        self._update_state()
+        state = self.state
         self.step_count += 1
         if self.render_mode == 'human':
             self.render()
@@ -488,7 +513,7 @@ class Env(gym.Env):
         da = (action - self.last_a) / self.timestep
         self.last_a = action
 
-        q = self._get_q()
+        q = state['q']
         qh = q[[0, 2, 4, 6]]
         self.qh_history[self.qh_history_ptr] = qh
         self.qh_history_ptr += 1
@@ -507,23 +532,25 @@ class Env(gym.Env):
             (qk - 0).clip(max=0)  # lower bound
         )
 
-        collisions = 0
-        for pair in zip(self.data.contact.geom1, self.data.contact.geom2):
-            if self.floor_id not in pair:
-                # collision between geoms other than floor
-                collisions += 1
-            else:
-                if all([foot_id not in pair for foot_id in self.foot_ids]):
-                    # collision between floor and geoms other than foot
-                    collisions += 1
+        # Contacts by class, see self.contact_classes. Any contact other than
+        # between floor and foot is a collision.
+        contact_geoms = self.data.contact.geom
+        floor = np.any(self.geom_floor[contact_geoms], axis=-1)
+        foot = np.any(self.geom_foot[contact_geoms], axis=-1)
+        contact_counts = np.bincount(
+            floor.astype(int) + (floor & foot),
+            minlength=len(self.contact_classes)
+        )
+        self.contact_counts += contact_counts
+        collisions = contact_counts[0] + contact_counts[1]
 
         p = np.clip(
-            self._get_tau() * self._get_dq(),
+            state['tau'] * state['dq'],
             0, None
         )
 
-        v = robot_mat.T @ self._get_v_w()
-        w = robot_mat.T @ self._get_w_w()
+        v = robot_mat.T @ state['v_w']
+        w = robot_mat.T @ state['w_w']
 
         reward = np.array([
             2 * np.exp(-1 / self.reward_v_tau * (
@@ -533,26 +560,29 @@ class Env(gym.Env):
             )),
             -5 * v[2]**2,
             -1e-5 * np.sum(da**2),
-            -10 * self._get_n()[1]**2,
+            -10 * state['n'][1]**2,
             -5 * np.sum(qh_diff**2),
             -100 * np.sum(qk_off_limits**2),
             -1 * collisions,
-            -0.5 * np.sum(self._get_tau()**2),
+            -0.5 * np.sum(state['tau']**2),
             -0.02 * np.sum(p),
             0
         ])
         reward = np.clip(reward, -self.reward_max, self.reward_max)
         reward[-1] = np.sum(reward)
-        for i, r in enumerate(reward):
-            if i > len(self.rewards) - 1:
-                self.rewards.append(deque())
-            self.rewards[i].append(r)
+        if self.step_count > len(self.reward_history):
+            # Stepped past max_steps
+            self.reward_history = np.concatenate([
+                self.reward_history, np.zeros(self.reward_history.shape)
+            ])
+        self.reward_history[self.step_count - 1] = reward
+        self.reward_sums += reward
 
         terminated = warned
         bound = self.model.hfield("floor").size[0] - self.hfield_pad
         out_of_bound = (
-            np.abs(self._get_pos()[0]) > bound or
-            np.abs(self._get_pos()[1]) > bound
+            np.abs(state['pos'][0]) > bound or
+            np.abs(state['pos'][1]) > bound
         )
         time_limited = self.step_count >= self.max_steps
         truncated = time_limited or out_of_bound
@@ -561,43 +591,104 @@ class Env(gym.Env):
         info = self._get_info()
         if terminated or truncated:
             # Calculate mean rewards
-            rewards = {}
-            for k, v in zip(
-                [
-                    'v',
-                    'dz', 'da',
-                    'ny', 'qhd', 'qkol', 'col',
-                    'tau', 'p',
-                    'total'
-                ],
-                self.rewards
-            ):
-                rewards[k] = np.mean(v)
+            rewards = dict(zip(
+                self.reward_names, self.reward_sums / self.step_count
+            ))
             rewards['length'] = self.step_count
 
             info = {
                 **info,
                 'reward': rewards,
+                # Mean number of contacts per step
+                'contacts': dict(zip(
+                    self.contact_classes,
+                    self.contact_counts / self.step_count
+                )),
                 'curriculum': {
                     'cell': self.curriculum_cell,
                     'score': rewards['v'] if not terminated else 0
                 }
             }
 
+        if self.recorder is not None:
+            self._record_states()
+
         return observation, reward[-1], terminated, truncated, info
 
+    def _compile_model(self):
+        if self.sub_indices is None:
+            for k, v in self._model_params.items():
+                # Pad keys
+                self.model_string = re.sub(
+                    r'\b%s\b' % k, f'{k:30}',
+                    self.model_string
+                )
+            self.sub_indices = []
+            for k, v in self._model_params.items():
+                # Record indices
+                self.sub_indices.append([
+                    m.start()
+                    for m in re.finditer(r'\b%s\b' % k, self.model_string)
+                ])
+        if self.del_indices_front is None:
+            self.del_indices_front = [
+                [m.start(), m.end()]
+                for m in re.finditer(
+                    r'<body name=\"ps_f.\">[\s\S]*?</body>[\s\S]*?</body>',
+                    self.model_string
+                )
+            ]
+            self.del_indices_front += [
+                [m.start(), m.end()]
+                for m in re.finditer(
+                    r'<connect name=\"input_ps_coupler_f.\"[\s\S]*?>',
+                    self.model_string
+                )
+            ]
+        if self.del_indices_rear is None:
+            self.del_indices_rear = [
+                [m.start(), m.end()]
+                for m in re.finditer(
+                    r'<body name=\"ps_r.\">[\s\S]*?</body>[\s\S]*?</body>',
+                    self.model_string
+                )
+            ]
+            self.del_indices_rear += [
+                [m.start(), m.end()]
+                for m in re.finditer(
+                    r'<connect name=\"input_ps_coupler_r.\"[\s\S]*?>',
+                    self.model_string
+                )
+            ]
+        model_string = list(self.model_string)
+        for (k, v), indices in zip(self._model_params.items(), self.sub_indices):
+            for i in indices:
+                model_string[i:i + 30] = f'{str(v):30}'
+        if self.leg_param_front[3] == 0:
+            # Remove ps related bodies
+            for indices in self.del_indices_front:
+                model_string[indices[0]:indices[1]] = (
+                    ' ' * (indices[1] - indices[0])
+                )
+        if self.leg_param_rear[3] == 0:
+            # Remove ps related bodies
+            for indices in self.del_indices_rear:
+                model_string[indices[0]:indices[1]] = (
+                    ' ' * (indices[1] - indices[0])
+                )
+        model_string = ''.join(model_string)
+        return mujoco.MjModel.from_xml_string(model_string, {})
+
     def render(self):
         def mj_render():
-            scn = mujoco.MjvScene(self.model, maxgeom=1000)
-            con = mujoco.MjrContext(
-                self.model, mujoco.mjtFontScale.mjFONTSCALE_100
-            )
-            mujoco.mjv_updateScene(
-                self.model, self.data,
-                self.opt, None, self.cam, mujoco.mjtCatBit.mjCAT_ALL, scn
+            self.renderer.set_model(self.model)
+            self.renderer.upload_hfield(
+                self.model.hfield('floor').id, self.hfield_terrain
             )
+            scn = self.renderer.update_scene(self.data, self.opt, self.cam)
 
-            if scn.ngeom >= scn.maxgeom:
+            if scn.ngeom + 2 > scn.maxgeom:
+                self.renderer.render()
                 return
             scn.ngeom += 2
             force_id = scn.ngeom - 2
@@ -616,7 +707,7 @@ class Env(gym.Env):
                 np.array([1, 0, 1, 1]).astype(np.float32)
             )
 
-            robot_tf = self._get_robot_tf()
+            robot_tf = self.state['robot_tf']
             _p1 = np.array([self.x, 0, self.z])
             _p1p = _p1 + np.array([0.001, 0, 0])
             _p2 = _p1 + np.array([self.fx, 0, self.fz]) * 0.1
@@ -635,58 +726,60 @@ class Env(gym.Env):
                 0.01, p1, p1p
             )
 
-            mujoco.mjr_render(self.viewport, scn, con)
+            self.renderer.render()
             # mujoco.mjr_text(
             #     mujoco.mjtFont.mjFONT_NORMAL,
             #     f't_sim: {self.data.time:.2f}',
-            #     con,
+            #     self.renderer.context,
             #     0, 0,
             #     0, 0, 0
             # )
 
-            return con
+        if self.render_mode is None:
+            return None
+
+        if self.render_mode == 'human' and self.window is None:
+            glfw.init()
+            self.window = glfw.create_window(
+                self.viewport.width, self.viewport.height,
+                'Quadruped',
+                None, None
+            )
+            (
+                self.viewport.width,
+                self.viewport.height
+            ) = glfw.get_framebuffer_size(self.window)
+            glfw.make_context_current(self.window)
+            glfw.swap_interval(1)
+        if self.renderer is None:
+            self.renderer = renderer.Renderer(
+                self.viewport,
+                offscreen=self.render_mode == 'rgb_array',
+                backend=self.render_backend
+            )
+
+        # Frames are rendered at render_fps, and rgb_array returns None for
+        # the steps in between
+        self.fps_step_count += 1
+        if (
+            self.fps_step_count * self.timestep <=
+            1 / self.metadata['render_fps'] - 1e-6
+        ):
+            return None
+        self.fps_step_count = 0
+        mj_render()
 
         if self.render_mode == 'human':
-            if self.window is None:
-                glfw.init()
-                self.window = glfw.create_window(
-                    self.viewport.width, self.viewport.height,
-                    'Quadruped',
-                    None, None
-                )
-                (
-                    self.viewport.width,
-                    self.viewport.height
-                ) = glfw.get_framebuffer_size(self.window)
-                glfw.make_context_current(self.window)
-                glfw.swap_interval(1)
-
-            self.fps_step_count += 1
-            if (
-                self.fps_step_count * self.timestep >
-                1 / self.metadata['render_fps'] - 1e-6
-            ):
-                mj_render()
-                self.fps_step_count = 0
-                glfw.swap_buffers(self.window)
-                glfw.poll_events()
+            glfw.swap_buffers(self.window)
+            glfw.poll_events()
 
         if self.render_mode == 'rgb_array':
-            gl_con = mujoco.GLContext(
-                self.viewport.width, self.viewport.height
-            )
-            gl_con.make_current()
-            con = mj_render()
-            img = np.empty(
-                (self.viewport.height, self.viewport.width, 3),
-                dtype=np.uint8
-            )
-            mujoco.mjr_readPixels(
-                rgb=img, depth=None, viewport=self.viewport, con=con
-            )
-            return np.flip(img, axis=0)
+            return self.renderer.read_pixels()
 
     def close(self):
+        if self.renderer is not None:
+            self.renderer.free()
+            self.renderer = None
         if self.window is not None:
             glfw.terminate()
             self.window = None
@@ -696,27 +789,61 @@ class Env(gym.Env):
             self.curriculum_cells_shared.unlink()
             self.curriculum_cells_shared_name = None
 
+    @property
+    def rewards(self):
+        # Reward terms of the episode so far, (steps, terms), as a read only
+        # view
+        rewards = self.reward_history[:self.step_count]
+        rewards.flags.writeable = False
+        return rewards
+
+    def record_states(self, decimation=1):
+        # Record the states of every decimation steps into env.states,
+        # starting from the next reset
+        self.recorder = recorder.Recorder(
+            self.state_fields, self.max_steps, decimation=decimation
+        )
+
+    @property
+    def states(self):
+        return self.recorder.states
+
     def get_states(self):
-        robot_mat = self._get_robot_tf()[:3, :3]
+        state = self.state
+        robot_mat = state['robot_tf'][:3, :3]
         return np.concatenate([
             [self.data.time],
             [self.vx_cmd, self.wz_cmd],
-            self._get_q(),
-            self._get_dq(),
-            self._get_g(),
-            self._get_w(),
+            state['q'],
+            state['dq'],
+            state['g'],
+            state['w'],
             self.last_a,
-            self._get_pos(),
-            robot_mat.T @ self._get_v_w(),
-            self._get_tau(),
-            robot_mat.T @ self._get_w_w(),
+            state['pos'],
+            robot_mat.T @ state['v_w'],
+            state['tau'],
+            robot_mat.T @ state['w_w'],
         ])
 
+    def _record_states(self):
+        record = self.recorder.next()
+        if record is None:
+            return
+        state = self.state
+        robot_mat = state['robot_tf'][:3, :3]
+        record['t'] = self.data.time
+        record['cmd'] = [self.vx_cmd, self.wz_cmd]
+        for k in ['q', 'dq', 'g', 'w', 'pos', 'tau']:
+            record[k] = state[k]
+        record['a'] = self.last_a
+        record['v'] = robot_mat.T @ state['v_w']
+        record['w_robot'] = robot_mat.T @ state['w_w']
+
     def _get_obs(self):
-        q = self._get_q() - self.q_offset
-        dq = self._get_dq()
-        g = self._get_g()
-        w = self._get_w()
+        q = self.state['q'] - self.q_offset
+        dq = self.state['dq'].copy()
+        g = self.state['g'].copy()
+        w = self.state['w'].copy()
 
         q += self.np_random.uniform(-self.q_noise_max, self.q_noise_max)
         dq += self.np_random.uniform(-self.dq_noise_max, self.dq_noise_max)
@@ -767,56 +894,59 @@ class Env(gym.Env):
     def _get_info(self):
         return {}
 
-    def _get_robot_tf(self):
+    def _resolve_addresses(self):
+        # Addresses into data of the compiled model, resolved once per model
+        # instead of by name on every read
+        def sensor(name):
+            adr = self.model.sensor(name).adr[0]
+            return slice(adr, adr + self.model.sensor(name).dim[0])
+
+        self.pos_adr = sensor('body_framepos')
+        self.gyro_adr = sensor('body_gyro')
+        self.velocimeter_adr = sensor('body_velocimeter')
+        qposadr = self.model.joint('body').qposadr[0]
+        self.body_pos_adr = slice(qposadr, qposadr + 3)
+        self.quat_adr = slice(qposadr + 3, qposadr + 7)
+        dofadr = self.model.joint('body').dofadr[0]
+        self.v_w_adr = slice(dofadr, dofadr + 3)
+        self.w_w_adr = slice(dofadr + 3, dofadr + 6)
+        self.body_id = self.model.body('body').id
+
+    def _update_state(self):
+        # State after a reset or step, read by the observation, reward,
+        # rendering and get_states
+        data = self.data
         body_mat = np.zeros(9)
-        mujoco.mju_quat2Mat(body_mat, self.data.joint('body').qpos[3:7])
+        mujoco.mju_quat2Mat(body_mat, data.qpos[self.quat_adr])
         body_mat = body_mat.reshape(3, 3)
+
+        # Robot frame, with z normal to the floor and x along the body
         robot_z = self.hfield_n
         robot_y = np.cross(robot_z, body_mat[:, 0])
         robot_y /= np.linalg.norm(robot_y)
         robot_x = np.cross(robot_y, robot_z)
-        robot_mat = np.array([robot_x, robot_y, robot_z]).T
         robot_tf = np.eye(4)
-        robot_tf[:3, :3] = robot_mat.copy()
-        robot_tf[:3, 3] = self.data.joint('body').qpos[:3].copy()
-
-        return robot_tf
-
-    def _get_pos(self):
-        return self.data.sensor('body_framepos').data.copy()
-
-    def _get_g(self):
-        mat = np.zeros(9)
-        mujoco.mju_quat2Mat(mat, self.data.joint('body').qpos[3:7])
-        return mat.reshape(3, 3).T @ np.array([0, 0, -1])
-
-    def _get_n(self):
-        mat = np.zeros(9)
-        mujoco.mju_quat2Mat(mat, self.data.joint('body').qpos[3:7])
-        return mat.reshape(3, 3).T @ self.hfield_n
-
-    def _get_q(self):
-        return self.data.actuator_length.copy()
-
-    def _get_dq(self):
-        return self.data.actuator_velocity.copy()
-
-    def _get_tau(self):
-        # The servo is modelled as a spring damper.
-        # The torque should be the net torque.
-        return self.data.actuator_force - self._get_dq() * self._model_params['servo_b']
-
-    def _get_w(self):
-        return self.data.sensor('body_gyro').data.copy()
-
-    def _get_v(self):
-        return self.data.sensor('body_velocimeter').data.copy()
-
-    def _get_w_w(self):
-        return self.data.joint('body').qvel[3:].copy()
-
-    def _get_v_w(self):
-        return self.data.joint('body').qvel[:3].copy()
+        robot_tf[:3, :3] = np.array([robot_x, robot_y, robot_z]).T
+        robot_tf[:3, 3] = data.qpos[self.body_pos_adr]
+
+        dq = data.actuator_velocity.copy()
+        self.state = {
+            'q': data.actuator_length.copy(),
+            'dq': dq,
+            # The servo is modelled as a spring damper.
+            # The torque should be the net torque.
+            'tau': (
+                data.actuator_force - dq * self._model_params['servo_b']
+            ),
+            'pos': data.sensordata[self.pos_adr].copy(),
+            'w': data.sensordata[self.gyro_adr].copy(),
+            'v': data.sensordata[self.velocimeter_adr].copy(),
+            'w_w': data.qvel[self.w_w_adr].copy(),
+            'v_w': data.qvel[self.v_w_adr].copy(),
+            'g': body_mat.T @ np.array([0, 0, -1]),
+            'n': body_mat.T @ self.hfield_n,
+            'robot_tf': robot_tf,
+        }
 
     def _mju_user_warning(self, e):
         raise ValueError(e)
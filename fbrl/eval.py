@@ -9,6 +9,7 @@ from fbrl.env import Env
 
 def eval_leg(leg_index):
     env = Env()
+    env.record_states()
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     checkpoint = torch.load(
         os.path.join('data', 'fbrl_checkpoint.pt'),
@@ -38,7 +39,6 @@ def eval_leg(leg_index):
                 'curriculum_cell': np.array([leg_index, *cell])
             })
 
-            states = []
             for _ in range(num_steps):
                 obs = torch.Tensor(obs).to(device)
                 with torch.no_grad():
@@ -46,26 +46,24 @@ def eval_leg(leg_index):
                 obs, reward, terminated, truncated, info = env.step(
                     action.cpu().numpy()
                 )
-                states.append(env.get_states())
                 if terminated or truncated:
                     break
             env.close()
 
-            if len(states) < num_steps:
+            if len(env.states) < num_steps:
                 print('Early break')
                 continue
 
             n += 1
-            states = np.array(states)
-            states = states[index_start:, :]
-            t = states[:, 0]
-            q = states[:, 3:11]
-            dq = states[:, 11:19]
-            g = states[:, 19:22]
-            w = states[:, 22:25]
-            a = states[:, 25:33]
-            v = states[:, 36:39]
-            tau = states[:, 39:47]
+            states = env.states[index_start:]
+            t = states['t']
+            q = states['q']
+            dq = states['dq']
+            g = states['g']
+            w = states['w']
+            a = states['a']
+            v = states['v']
+            tau = states['tau']
 
             p = np.sum((tau * dq).clip(min=0), axis=1)
             vx = v[:, 0]
@@ -75,7 +73,7 @@ def eval_leg(leg_index):
                 cot = np.mean(p) / m / 9.81 / vx_mean
             else:
                 cot = np.nan
-            score = np.mean(np.array(env.rewards[0])[index_start:])
+            score = np.mean(env.rewards[index_start:, 0])
             metric.append([
                 score,
                 cot,
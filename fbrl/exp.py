@@ -13,6 +13,7 @@ if __name__ == "__main__":
     fx = float(sys.argv[4])
     fz = float(sys.argv[5])
     record = 'r' in sys.argv
+    save = 's' in sys.argv
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     checkpoint = torch.load(
@@ -21,7 +22,7 @@ if __name__ == "__main__":
     )
 
     env = Env(render_mode='human' if not record else 'rgb_array')
-    env.metadata['render_fps'] = 50 if not record else 100
+    env.metadata['render_fps'] = 50 if not record else 25
     env.model_params['hfield_texrepeat'] = 2
     env.model_params['hfield_nr'] = 100
     env.model_params['hfield_r'] = 1
@@ -32,9 +33,9 @@ if __name__ == "__main__":
     ).to(device)
     agent.load_state_dict(checkpoint['agent'])
     agent.eval()
+    env.record_states()
 
     frames = []
-    states = []
     options = {
         'vx_cmd': 0.2,
         'wz_cmd': 0,
@@ -57,9 +58,10 @@ if __name__ == "__main__":
         obs, reward, terminated, truncated, info = env.step(
             action.cpu().numpy()
         )
-        if record and i % 4 == 0:
-            frames.append(env.render())
-        states.append(env.get_states())
+        if record:
+            frame = env.render()
+            if frame is not None:
+                frames.append(frame)
         if terminated or truncated:
             print(info)
             break
@@ -73,16 +75,20 @@ if __name__ == "__main__":
             f'env_{env.leg_index:d}.mp4'
         ))
 
-    states = np.array(states)
-    t = states[:, 0]
-    v = states[:, 36:39]
-    w = states[:, 22:25]
-    q = states[:, 3:11]
-    dq = states[:, 11:19]
-    g = states[:, 19:22]
-    w = states[:, 22:25]
-    a = states[:, 25:33]
-    pos = states[:, 33:40]
+    if save:
+        env.recorder.save(os.path.join(
+            'logs', 'fbrl', f'states_{env.leg_index:d}.npy'
+        ))
+
+    states = env.states
+    t = states['t']
+    v = states['v']
+    w = states['w']
+    q = states['q']
+    dq = states['dq']
+    g = states['g']
+    a = states['a']
+    pos = states['pos']
 
     plt.figure()
     plt.subplot(211)
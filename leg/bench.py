@@ -0,0 +1,186 @@
+import os
+import argparse
+import json
+import time
+import platform
+import numpy as np
+from leg import four_bar
+from leg import model
+from leg import opt
+from leg import kernel
+
+SEED = 0
+NUM_LEGS = 10
+NUM_REPEATS = 5
+BASELINE_PATH = os.path.join('logs', 'leg', 'bench_baseline.json')
+SLOWDOWN_TOL = 0.2  # of the baseline time
+
+
+def load_legs(num_legs=NUM_LEGS, seed=SEED):
+    # Fixed designs x and tasks p from the search checkpoint
+    legs = np.array(np.load(
+        os.path.join('data', 'leg_checkpoint.npy'), allow_pickle=True
+    ).item()['legs'])
+    rng = np.random.default_rng(seed)
+    legs = legs[np.sort(rng.choice(len(legs), num_legs, replace=False))]
+    return legs[:, :8], legs[:, 8:]
+
+
+def timeit(f, num_repeats=NUM_REPEATS):
+    # Time per call in seconds, over num_repeats runs after a warm up run
+    f()
+    times = []
+    for _ in range(num_repeats):
+        t0 = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t0)
+    times = np.array(times)
+    return {
+        'mean': float(np.mean(times)),
+        'min': float(np.amin(times)),
+        'std': float(np.std(times)),
+        'num_repeats': num_repeats
+    }
+
+
+def run(num_repeats=NUM_REPEATS, vectorized=False):
+    X, P = load_legs()
+
+    def solve():
+        for x in X:
+            l_ab, l_bc, l_cd, l_ad, _, input_offset, _, _ = x
+            for t in np.linspace(0, np.pi / 2, model.NUM_KEYFRAMES):
+                four_bar.solve(
+                    l_ab, l_bc, l_cd, l_ad, t + input_offset, True
+                )
+
+    def sim():
+        for x, p in zip(X, P):
+            model.sim(x, p)
+
+    def mj_params():
+        for x, p in zip(X, P):
+            model.mj_params(x, p)
+
+    def obj():
+        for x, p in zip(X, P):
+            opt.obj(x, p)
+
+    # Each function call is timed per design point
+    results = {
+        name: timeit(f, num_repeats=num_repeats)
+        for name, f in [
+            ('four_bar.solve', solve),
+            ('model.sim', sim),
+            ('model.mj_params', mj_params),
+            ('opt.obj', obj),
+        ]
+    }
+    for r in results.values():
+        for k in ['mean', 'min', 'std']:
+            r[k] /= len(X)
+
+    # One full optimization, which is run once as it is seeded
+    t0 = time.perf_counter()
+    r = opt.optimize(P[0], seed=SEED, vectorized=vectorized, workers=1)
+    t = time.perf_counter() - t0
+    results['opt.optimize'] = {
+        'mean': t,
+        'min': t,
+        'nfev': int(r.nfev),
+        'nit': int(r.nit),
+        'fun': float(r.fun)
+    }
+
+    return {
+        'meta': {
+            'time': int(time.time()),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'kernel': kernel.ENABLED,
+            'vectorized': vectorized,
+            'seed': SEED,
+            'num_legs': NUM_LEGS
+        },
+        'results': results
+    }
+
+
+def check_keyframes():
+    # Keyframes solved on their own, as by model.mj_params, have to match
+    # the full solve bit for bit. Returns the designs that do not.
+    X, P = load_legs()
+    mismatches = []
+    for i, (x, p) in enumerate(zip(X, P)):
+        full = model.sim(x, p)
+        ends = model.sim(x, p, keyframes=[0, -1])
+        same = np.array_equal(full['femur'], ends['femur']) and all(
+            np.array_equal(full[k][[0, -1]], ends[k])
+            for k in ['legs', 'feet', 'feet_ref', 'ps_torques']
+        )
+        if not same:
+            mismatches.append(i)
+    return mismatches
+
+
+def compare(bench, baseline, tol=SLOWDOWN_TOL):
+    # Ratio of the best times against the baseline, and the names of the
+    # benchmarks that slowed down by more than tol. The best time is less
+    # sensitive to the load of the machine than the mean.
+    ratios = {}
+    slower = []
+    for name, r in bench['results'].items():
+        if name not in baseline['results']:
+            continue
+        ratios[name] = r['min'] / baseline['results'][name]['min']
+        if ratios[name] > 1 + tol:
+            slower.append(name)
+    return ratios, slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_repeats', type=int, default=NUM_REPEATS)
+    parser.add_argument(
+        '--vectorized',
+        default=False,
+        action=argparse.BooleanOptionalAction
+    )
+    parser.add_argument('--output', type=str, default=None)
+    parser.add_argument('--baseline', type=str, default=BASELINE_PATH)
+    parser.add_argument(
+        '--save_baseline',
+        default=False,
+        action=argparse.BooleanOptionalAction
+    )
+    args = parser.parse_args()
+
+    mismatches = check_keyframes()
+    if len(mismatches) > 0:
+        print(f'keyframes differ from the full solve: {mismatches}')
+        exit(1)
+
+    bench = run(num_repeats=args.num_repeats, vectorized=args.vectorized)
+    for name, r in bench['results'].items():
+        print(f'{name}: {r["mean"] * 1e3:.3f} ms')
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(bench, file, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(bench, file, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        for k in ['kernel', 'vectorized', 'num_legs']:
+            if bench['meta'][k] != baseline['meta'][k]:
+                print(f'{k} differs from baseline: {baseline["meta"][k]}')
+        ratios, slower = compare(bench, baseline)
+        for name, ratio in ratios.items():
+            print(f'{name}: {ratio:.2f}x baseline')
+        if len(slower) > 0:
+            print(f'slower than baseline: {", ".join(slower)}')
+            exit(1)
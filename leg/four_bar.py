@@ -4,6 +4,13 @@ from leg import helper
 
 
 def solve(l_ab, l_bc, l_cd, l_ad, theta_bad, crossed):
+    # Inputs broadcast against each other, so a whole sweep of crank angles
+    # and/or designs is solved at once. Returns linkages of shape
+    # (..., 4, 2, 2) and a mask of the configurations that can be assembled.
+    l_ab, l_bc, l_cd, l_ad, theta_bad, crossed = np.broadcast_arrays(
+        l_ab, l_bc, l_cd, l_ad, theta_bad, crossed
+    )
+
     l_bd = np.sqrt(l_ad**2 + l_ab**2 - 2 * l_ad * l_ab * np.cos(theta_bad))
 
     cos_theta_bcd = (l_bc**2 + l_cd**2 - l_bd**2) / (2 * l_bc * l_cd)
@@ -11,11 +18,11 @@ def solve(l_ab, l_bc, l_cd, l_ad, theta_bad, crossed):
     # if np.abs(np.abs(cos_theta_bcd) - 1) < 1e-3:
     #     cos_theta_bcd = 1
 
-    assert np.abs(cos_theta_bcd) <= 1 and not np.isnan(cos_theta_bcd)
+    # NaN compares to False, so it is invalid as well
+    valid = np.abs(cos_theta_bcd) <= 1
 
-    sin_theta_bcd = np.sqrt(1 - cos_theta_bcd**2)
-    if crossed:
-        sin_theta_bcd = -sin_theta_bcd
+    sin_theta_bcd = np.sqrt(np.clip(1 - cos_theta_bcd**2, 0, None))
+    sin_theta_bcd = np.where(crossed, -sin_theta_bcd, sin_theta_bcd)
 
     theta_bdc = np.arctan2(
         l_bc / l_bd * sin_theta_bcd,
@@ -29,41 +36,46 @@ def solve(l_ab, l_bc, l_cd, l_ad, theta_bad, crossed):
 
     theta_adc = theta_adb + theta_bdc
 
-    pt_abcd = np.array([
-        [0, 0],
-        [l_ab * np.cos(theta_bad), l_ab * np.sin(theta_bad)],
-        [
+    zeros = np.zeros(theta_bad.shape)
+    pt_abcd = np.stack([
+        np.stack([zeros, zeros], axis=-1),
+        np.stack([
+            l_ab * np.cos(theta_bad), l_ab * np.sin(theta_bad)
+        ], axis=-1),
+        np.stack([
             l_cd * np.cos(np.pi - theta_adc) + l_ad,
             l_cd * np.sin(np.pi - theta_adc)
-        ],
-        [l_ad, 0]
-    ])
+        ], axis=-1),
+        np.stack([l_ad, zeros], axis=-1),
+    ], axis=-2)
 
-    lkg_abcd = np.array([
-        pt_abcd[:2, :],
-        pt_abcd[1:3, :],
-        pt_abcd[2:4, :],
-        pt_abcd[[0, 3], :],
-    ])
+    lkg_abcd = pt_abcd[..., [0, 1, 1, 2, 2, 3, 0, 3], :].reshape(
+        theta_bad.shape + (4, 2, 2)
+    )
 
-    return lkg_abcd
+    return lkg_abcd, valid
 
 
 def transmission_angle(lkg):
-    angle = np.abs(helper.angle_between_links(lkg[1], lkg[2]))
-    if angle > np.pi / 2:
-        # map to 0 to np.pi/2
-        angle = np.pi - angle
-    return angle
+    angle = np.abs(helper.angle_between_links(
+        lkg[..., 1, :, :], lkg[..., 2, :, :]
+    ))
+    # map to 0 to np.pi/2
+    return np.where(angle > np.pi / 2, np.pi - angle, angle)
 
 
 def input_torque(tau, lkg):
-    t_dcb = np.pi + helper.angle_between_links(lkg[1], lkg[2])
-    assert np.abs(np.sin(t_dcb)) > 1e-3, 'Near singularity'
+    # Returns the torque and a mask of the configurations away from singularity
+    t_dcb = np.pi + helper.angle_between_links(
+        lkg[..., 1, :, :], lkg[..., 2, :, :]
+    )
+    valid = np.abs(np.sin(t_dcb)) > 1e-3
 
-    l_cd = helper.link_length(lkg[2])
+    l_cd = helper.link_length(lkg[..., 2, :, :])
     f = tau / l_cd / np.sin(t_dcb)
 
-    t_cba = np.pi + helper.angle_between_links(lkg[0], lkg[1])
-    l_ab = helper.link_length(lkg[0])
-    return f * np.sin(t_cba) * l_ab
+    t_cba = np.pi + helper.angle_between_links(
+        lkg[..., 0, :, :], lkg[..., 1, :, :]
+    )
+    l_ab = helper.link_length(lkg[..., 0, :, :])
+    return f * np.sin(t_cba) * l_ab, valid
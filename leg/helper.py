@@ -3,39 +3,47 @@ import matplotlib.pyplot as plt
 
 
 def angle_between_links(lk1, lk2):
-    v1 = lk1[1, :] - lk1[0, :]
-    v2 = lk2[1, :] - lk2[0, :]
+    v1 = lk1[..., 1, :] - lk1[..., 0, :]
+    v2 = lk2[..., 1, :] - lk2[..., 0, :]
 
     return np.arctan2(
-        v1[0] * v2[1] - v1[1] * v2[0],
-        np.dot(v1, v2)
+        v1[..., 0] * v2[..., 1] - v1[..., 1] * v2[..., 0],
+        np.sum(v1 * v2, axis=-1)
     )
 
 
 def link_angle(lk):
-    p1 = lk[0, :]
-    p2 = lk[1, :]
-    return np.arctan2(p2[1] - p1[1], p2[0] - p1[0])
+    p1 = lk[..., 0, :]
+    p2 = lk[..., 1, :]
+    return np.arctan2(p2[..., 1] - p1[..., 1], p2[..., 0] - p1[..., 0])
 
 
 def link_length(lk):
-    return np.linalg.norm(lk[1, :] - lk[0, :])
+    return np.linalg.norm(lk[..., 1, :] - lk[..., 0, :], axis=-1)
 
 
 def transform_points(theta, x, y, pts, inverse=False):
-    t = np.array([
-        [np.cos(theta), -np.sin(theta), x],
-        [np.sin(theta), np.cos(theta), y],
-        [0, 0, 1]
-    ])
-    if inverse:
-        t = np.linalg.inv(t)
-
-    pts_tf = (
-        t @ np.concatenate([pts, np.ones((pts.shape[0], 1))], axis=1).T
-    ).T[:, :2]
+    # Rigid transform of pts (..., 2). theta, x and y broadcast against the
+    # leading dimensions of pts. The inverse is applied in closed form.
+    theta, x, y = (np.asarray(v)[..., None] for v in (theta, x, y))
+    c = np.cos(theta)
+    s = np.sin(theta)
+    pts = np.asarray(pts)
+    pts_x = pts[..., 0]
+    pts_y = pts[..., 1]
 
-    return pts_tf
+    if inverse:
+        pts_x = pts_x - x
+        pts_y = pts_y - y
+        return np.stack([
+            c * pts_x + s * pts_y,
+            -s * pts_x + c * pts_y
+        ], axis=-1)
+
+    return np.stack([
+        c * pts_x - s * pts_y + x,
+        s * pts_x + c * pts_y + y
+    ], axis=-1)
 
 
 def points_center(pts):
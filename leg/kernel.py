@@ -0,0 +1,175 @@
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Compiled keyframe loop of leg.model.sim_linkages. Without numba, the NumPy
+# version in leg.model is used instead.
+ENABLED = numba is not None
+
+
+def _solve(l_ab, l_bc, l_cd, l_ad, theta_bad, crossed):
+    # Same as four_bar.solve for one configuration. A is at the origin and D
+    # on the x axis, so only B and C are returned.
+    l_bd = math.sqrt(
+        l_ad**2 + l_ab**2 - 2 * l_ad * l_ab * math.cos(theta_bad)
+    )
+    cos_theta_bcd = (l_bc**2 + l_cd**2 - l_bd**2) / (2 * l_bc * l_cd)
+    valid = abs(cos_theta_bcd) <= 1
+
+    sin_theta_bcd = math.sqrt(max(1 - cos_theta_bcd**2, 0.0))
+    if crossed:
+        sin_theta_bcd = -sin_theta_bcd
+
+    theta_bdc = math.atan2(
+        l_bc / l_bd * sin_theta_bcd,
+        (l_bd**2 + l_cd**2 - l_bc**2) / (2 * l_bd * l_cd)
+    )
+    theta_adb = math.atan2(
+        l_ab / l_bd * math.sin(theta_bad),
+        (l_bd**2 + l_ad**2 - l_ab**2) / (2 * l_bd * l_ad)
+    )
+    theta_adc = theta_adb + theta_bdc
+
+    return (
+        l_ab * math.cos(theta_bad), l_ab * math.sin(theta_bad),
+        l_cd * math.cos(math.pi - theta_adc) + l_ad,
+        l_cd * math.sin(math.pi - theta_adc),
+        valid
+    )
+
+
+def _angle_between(v1_x, v1_y, v2_x, v2_y):
+    return math.atan2(v1_x * v2_y - v1_y * v2_x, v1_x * v2_x + v1_y * v2_y)
+
+
+def _set_link(lkg, i, pt_0_x, pt_0_y, pt_1_x, pt_1_y):
+    lkg[i, 0, 0] = pt_0_x
+    lkg[i, 0, 1] = pt_0_y
+    lkg[i, 1, 0] = pt_1_x
+    lkg[i, 1, 1] = pt_1_y
+
+
+def _set_four_bar(lkg, i, b_x, b_y, c_x, c_y, d_x):
+    _set_link(lkg, i, 0.0, 0.0, b_x, b_y)
+    _set_link(lkg, i + 1, b_x, b_y, c_x, c_y)
+    _set_link(lkg, i + 2, c_x, c_y, d_x, 0.0)
+    _set_link(lkg, i + 3, 0.0, 0.0, d_x, 0.0)
+
+
+def _sim_linkages(
+    l_ab, l_bc, l_cd, l_ad, input_offset,
+    l_af, l_fg, l_gh, l_ah, t_fah, t_had, k_ps,
+    pt_e_local, pt_j_local, inputs
+):
+    n = l_ab.shape[0]
+    k = inputs.shape[0]
+    legs = np.empty((n, k, 10, 2, 2))
+    ps_torques = np.empty((n, k))
+    ps_torques_local = np.empty((n, k))
+    valid = np.ones(n, dtype=np.bool_)
+
+    for i in range(n):
+        c_had = math.cos(t_had[i])
+        s_had = math.sin(t_had[i])
+        for j in range(k):
+            lkg = legs[i, j]
+
+            # Spring linkage, rotated by t_had about A
+            b_x, b_y, c_x, c_y, valid_spring = _solve(
+                l_af, l_fg[i], l_gh[i], l_ah[i], t_fah[i] + inputs[j], False
+            )
+            d_x = l_ah[i]
+
+            ps_torques_local[i, j] = (
+                -_angle_between(c_x - d_x, c_y, d_x, 0.0) + t_had[i]
+            ) * k_ps[i]
+
+            # Same as four_bar.input_torque
+            t_dcb = math.pi + _angle_between(
+                c_x - b_x, c_y - b_y, d_x - c_x, -c_y
+            )
+            t_cba = math.pi + _angle_between(b_x, b_y, c_x - b_x, c_y - b_y)
+            valid_torque = abs(math.sin(t_dcb)) > 1e-3
+            ps_torques[i, j] = (
+                ps_torques_local[i, j] /
+                math.hypot(d_x - c_x, -c_y) / math.sin(t_dcb) *
+                math.sin(t_cba) * math.hypot(b_x, b_y)
+            )
+
+            t_ab = math.atan2(b_y, b_x)
+            j_x = math.cos(t_ab) * pt_j_local[i, 0] - \
+                math.sin(t_ab) * pt_j_local[i, 1]
+            j_y = math.sin(t_ab) * pt_j_local[i, 0] + \
+                math.cos(t_ab) * pt_j_local[i, 1]
+
+            _set_four_bar(lkg, 0, b_x, b_y, c_x, c_y, d_x)
+            _set_link(lkg, 4, 0.0, 0.0, j_x, j_y)
+            for m in range(5):
+                for o in range(2):
+                    pt_x = lkg[m, o, 0]
+                    pt_y = lkg[m, o, 1]
+                    lkg[m, o, 0] = c_had * pt_x - s_had * pt_y
+                    lkg[m, o, 1] = s_had * pt_x + c_had * pt_y
+
+            # Main linkage with the foot link
+            b_x, b_y, c_x, c_y, valid_main = _solve(
+                l_ab[i], l_bc[i], l_cd[i], l_ad[i],
+                inputs[j] + input_offset[i], True
+            )
+            t_bc = math.atan2(c_y - b_y, c_x - b_x)
+            e_x = math.cos(t_bc) * pt_e_local[i, 0] - \
+                math.sin(t_bc) * pt_e_local[i, 1] + b_x
+            e_y = math.sin(t_bc) * pt_e_local[i, 0] + \
+                math.cos(t_bc) * pt_e_local[i, 1] + b_y
+
+            _set_four_bar(lkg, 5, b_x, b_y, c_x, c_y, l_ad[i])
+            _set_link(lkg, 9, b_x, b_y, e_x, e_y)
+
+            valid[i] = valid[i] and valid_spring and valid_main and \
+                valid_torque
+
+        # Transform based on foot initial and end position
+        theta = math.atan2(
+            legs[i, k - 1, 9, 1, 1] - legs[i, 0, 9, 1, 1],
+            legs[i, k - 1, 9, 1, 0] - legs[i, 0, 9, 1, 0]
+        ) - math.pi / 2
+        c = math.cos(theta)
+        s = math.sin(theta)
+        for j in range(k):
+            for m in range(10):
+                for o in range(2):
+                    pt_x = legs[i, j, m, o, 0]
+                    pt_y = legs[i, j, m, o, 1]
+                    legs[i, j, m, o, 0] = c * pt_x + s * pt_y
+                    legs[i, j, m, o, 1] = -s * pt_x + c * pt_y
+
+    return legs, ps_torques, ps_torques_local, valid
+
+
+if ENABLED:
+    _jit = numba.njit(error_model='numpy', cache=True)
+    _solve = _jit(_solve)
+    _angle_between = _jit(_angle_between)
+    _set_link = _jit(_set_link)
+    _set_four_bar = _jit(_set_four_bar)
+    _sim_linkages = _jit(_sim_linkages)
+
+
+def sim_linkages(
+    l_ab, l_bc, l_cd, l_ad, input_offset,
+    l_af, l_fg, l_gh, l_ah, t_fah, t_had, k_ps,
+    pt_e_local, pt_j_local, inputs
+):
+    # Contiguous float arrays keep to a single compiled specialization
+    args = [
+        np.ascontiguousarray(v, dtype=float) for v in (
+            l_ab, l_bc, l_cd, l_ad, input_offset,
+            l_fg, l_gh, l_ah, t_fah, t_had, k_ps,
+            pt_e_local, pt_j_local, inputs
+        )
+    ]
+    return _sim_linkages(*args[:5], float(l_af), *args[5:])
@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from leg import four_bar
 from leg import helper
+from leg import kernel
 
 NUM_KEYFRAMES = 11
 E_MAX = 1
@@ -42,101 +43,110 @@ Y_PS = 0.001 + W_LINK
 
 L_FOOT = 0.01
 
+# Box geoms of mj_params, as (name, link, side of the link offset, y or
+# None, width). Link 10 is the coupler from the rocker to the foot.
+LINK_BOXES = [
+    ('ground', 8, 1, None, W_LINK),
+    ('input', 0, 1, Y_INPUT, W_INPUT),
+    ('crank', 5, -1, None, W_LINK),
+    ('ss', 4, -1, Y_INPUT, W_INPUT),
+    ('rocker', 7, -1, None, W_LINK),
+    ('coupler', 10, 1, None, W_LINK),
+    ('foot', 10, 1, None, W_LINK),
+    ('ps', 2, 1, Y_PS, W_LINK),
+    ('ps_coupler', 1, 1, Y_PS, W_LINK),
+]
+# Joints and anchors of mj_params, as (name, link, end of the link)
+LINK_JOINTS = [
+    ('rocker_joint', 7, 1),
+    ('coupler_joint', 10, 0),
+    ('crank_anchor', 6, 0),
+    ('ps_joint', 2, 1),
+    ('ps_coupler_joint', 1, 1),
+    ('input_anchor', 1, 0),
+]
+
+
+def sim(x, p, keyframes=None):
+    result = sim_batch(np.array([x]), p, keyframes=keyframes)
+    assert result['valid'][0]
+
+    return unbatch(result, 0)
+
+
+def unbatch(result, i):
+    # Result of the i-th design of a sim_batch result
+    return {
+        k: v if k == 'inputs' else v[i]
+        for k, v in result.items() if k != 'valid'
+    }
 
-def sim(x, p):
-    l_ab, l_bc, l_cd, l_ad, l_be, input_offset, l_ps, l_ss = x
-    travel_offset, travel_length, input_range, parallel_stiffness, series_stiffness = p
 
-    # Constants for main and spring linkage
-    h = H_LINK_THIN + H_ADHESIVE + H_JOINT + H_ADHESIVE + H_LINK
-    t_cbe = -np.arccos(h / l_bc) - np.arccos(h / l_be)
-    pt_e_local = np.array([[l_be * np.cos(t_cbe), l_be * np.sin(t_cbe)]])
-
-    h_offset = H_LINK - H_LINK_THIN
-    l_gh = l_ps * GAMMA
-    l_ah = ((L_AI + l_ps * (1 - GAMMA))**2 + h_offset**2)**0.5
-    t_had = np.arcsin(h_offset / l_ah)
-    t_fah = np.pi + input_offset - t_had
-    l_fh = (l_ah**2 + L_AF**2 - 2 * l_ah * L_AF * np.cos(t_fah))**0.5
-    t_ahf = np.arcsin(L_AF / l_fh * np.sin(t_fah))
-    t_fhg = np.pi * 2 - (np.pi - t_had) - t_ahf
-    l_fg = (l_fh**2 + l_gh**2 - 2 * l_fh * l_gh * np.cos(t_fhg))**0.5
-    pt_j_local = np.array([[-(l_ss * GAMMA + L_J), 0]])
-
-    k_ps = GAMMA * K_THETA * E * (W_PS * H_LINK_THIN**3) / 12 / l_ps
-    k_ss = GAMMA * K_THETA * E * (W_SS * H_LINK**3) / 12 / l_ss
-
-    # Key points
-    legs = []
-    ps_torques = []
-    ps_torques_local = []
-    inputs = np.linspace(0, input_range, NUM_KEYFRAMES)
-    for input in inputs:
-        lkg_main = four_bar.solve(
-            l_ab, l_bc, l_cd, l_ad, input + input_offset, True
-        )
-        pt_e = helper.transform_points(
-            helper.link_angle(lkg_main[1]),
-            lkg_main[1][0, 0], lkg_main[1][0, 1],
-            pt_e_local
-        )[0]
-        lkg_main = np.concatenate([
-            lkg_main,
-            np.array([[lkg_main[1][0, :], pt_e]])
-        ])
-
-        lkg_spring = four_bar.solve(
-            L_AF, l_fg, l_gh, l_ah, t_fah + input, False
+def sim_batch(X, p, keyframes=None):
+    # Simulate a population of designs X (N, 8) for the same task p. Designs
+    # that cannot be assembled are flagged in result['valid'] instead of
+    # raising, and their entries are undefined. keyframes selects a subset
+    # of the keyframes, which has to keep the first and last ones as they
+    # define the foot frame.
+    l_ab, l_bc, l_cd, l_ad, l_be, input_offset, l_ps, l_ss = (
+        np.asarray(X, dtype=float).T
+    )
+    travel_offset, travel_length, input_range, parallel_stiffness, series_stiffness = p
+    n = len(l_ab)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Constants for main and spring linkage
+        h = H_LINK_THIN + H_ADHESIVE + H_JOINT + H_ADHESIVE + H_LINK
+        t_cbe = -np.arccos(h / l_bc) - np.arccos(h / l_be)
+        pt_e_local = np.stack([
+            l_be * np.cos(t_cbe), l_be * np.sin(t_cbe)
+        ], axis=-1)
+
+        h_offset = H_LINK - H_LINK_THIN
+        l_gh = l_ps * GAMMA
+        l_ah = ((L_AI + l_ps * (1 - GAMMA))**2 + h_offset**2)**0.5
+        t_had = np.arcsin(h_offset / l_ah)
+        t_fah = np.pi + input_offset - t_had
+        l_fh = (l_ah**2 + L_AF**2 - 2 * l_ah * L_AF * np.cos(t_fah))**0.5
+        t_ahf = np.arcsin(L_AF / l_fh * np.sin(t_fah))
+        t_fhg = np.pi * 2 - (np.pi - t_had) - t_ahf
+        l_fg = (l_fh**2 + l_gh**2 - 2 * l_fh * l_gh * np.cos(t_fhg))**0.5
+        pt_j_local = np.stack([
+            -(l_ss * GAMMA + L_J), np.zeros(n)
+        ], axis=-1)
+
+        k_ps = GAMMA * K_THETA * E * (W_PS * H_LINK_THIN**3) / 12 / l_ps
+        k_ss = GAMMA * K_THETA * E * (W_SS * H_LINK**3) / 12 / l_ss
+
+        # Key points, (N, keyframes, ...)
+        inputs = np.linspace(0, input_range, NUM_KEYFRAMES)
+        if keyframes is not None:
+            inputs = inputs[keyframes]
+        linkages = kernel.sim_linkages if kernel.ENABLED else sim_linkages
+        legs, ps_torques, ps_torques_local, valid = linkages(
+            l_ab, l_bc, l_cd, l_ad, input_offset,
+            L_AF, l_fg, l_gh, l_ah, t_fah, t_had, k_ps,
+            pt_e_local, pt_j_local, inputs
         )
-        tau = (
-            -helper.angle_between_links(-lkg_spring[2], lkg_spring[3]) -
-            -t_had
-        ) * k_ps
-        ps_torques.append(four_bar.input_torque(tau, lkg_spring))
-        ps_torques_local.append(tau)
-
-        pt_j = helper.transform_points(
-            helper.link_angle(lkg_spring[0]),
-            0, 0,
-            pt_j_local
-        )[0]
-        lkg_spring = np.concatenate([
-            lkg_spring,
-            np.array([[[0, 0], pt_j]])
-        ])
-        lkg_spring = helper.transform_points(
-            t_had, 0, 0, lkg_spring.reshape((-1, 2))
-        ).reshape(lkg_spring.shape)
-
-        lkg = np.concatenate([lkg_spring, lkg_main])
-
-        legs.append(lkg)
-    legs = np.array(legs)
-
-    # Transform based on foot initial and end position
-    legs = helper.transform_points(
-        helper.link_angle(legs[[0, -1], -1, 1, :]) - np.pi / 2,
-        0, 0,
-        legs.reshape((-1, 2)),
-        inverse=True
-    ).reshape(legs.shape)
 
-    feet_ref = np.array([
+    feet_ref = np.stack([
         # x offset
-        np.ones(NUM_KEYFRAMES) * legs[0, -1, 1, 0],
+        np.ones((n, len(inputs))) * legs[:, :1, -1, 1, 0],
         (
             # Even spacing
             travel_length / input_range * inputs +
             # y offset
-            legs[0, -1, 1, 1]
+            legs[:, :1, -1, 1, 1]
         ),
-    ]).T
-    feet = legs[:, -1, 1, :]
+    ], axis=-1)
+    feet = legs[:, :, -1, 1, :]
 
-    femur = np.array([
-        [0, 0,],
-        [feet_ref[-1, 0], travel_offset + feet_ref[-1, 1]],
-    ])
+    femur = np.stack([
+        np.zeros((n, 2)),
+        np.stack([
+            feet_ref[:, -1, 0], travel_offset + feet_ref[:, -1, 1]
+        ], axis=-1),
+    ], axis=-2)
 
     result = {
         'inputs': inputs,
@@ -147,198 +157,170 @@ def sim(x, p):
         'ps_torques': ps_torques,
         'ps_torques_local': ps_torques_local,
         'ps': k_ps,
-        'ss': k_ss
+        'ss': k_ss,
+        'valid': valid
     }
 
     return result
 
 
+def sim_linkages(
+    l_ab, l_bc, l_cd, l_ad, input_offset,
+    l_af, l_fg, l_gh, l_ah, t_fah, t_had, k_ps,
+    pt_e_local, pt_j_local, inputs
+):
+    # Linkages of the designs at the keyframes, in the foot frame. Design
+    # constants are (N,) and the local points (N, 2). leg.kernel has a
+    # compiled version of this with the same signature.
+    n = len(l_ab)
+    pt_e_local = pt_e_local[:, None, None, :]
+    pt_j_local = pt_j_local[:, None, None, :]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lkgs_main, valid_main = four_bar.solve(
+            l_ab[:, None], l_bc[:, None], l_cd[:, None], l_ad[:, None],
+            inputs + input_offset[:, None], True
+        )
+        lkgs_spring, valid_spring = four_bar.solve(
+            l_af, l_fg[:, None], l_gh[:, None], l_ah[:, None],
+            t_fah[:, None] + inputs, False
+        )
+
+        pt_e = helper.transform_points(
+            helper.link_angle(lkgs_main[..., 1, :, :]),
+            lkgs_main[..., 1, 0, 0], lkgs_main[..., 1, 0, 1],
+            pt_e_local
+        )[..., 0, :]
+        lkgs_main = np.concatenate([
+            lkgs_main,
+            np.stack(
+                [lkgs_main[..., 1, 0, :], pt_e], axis=-2
+            )[..., None, :, :]
+        ], axis=-3)
+
+        ps_torques_local = (
+            -helper.angle_between_links(
+                -lkgs_spring[..., 2, :, :], lkgs_spring[..., 3, :, :]
+            ) -
+            -t_had[:, None]
+        ) * k_ps[:, None]
+        ps_torques, valid_torque = four_bar.input_torque(
+            ps_torques_local, lkgs_spring
+        )
+
+        pt_j = helper.transform_points(
+            helper.link_angle(lkgs_spring[..., 0, :, :]),
+            0, 0,
+            pt_j_local
+        )[..., 0, :]
+        lkgs_spring = np.concatenate([
+            lkgs_spring,
+            np.stack(
+                [np.zeros(pt_j.shape), pt_j], axis=-2
+            )[..., None, :, :]
+        ], axis=-3)
+        lkgs_spring = helper.transform_points(
+            t_had[:, None], 0, 0,
+            lkgs_spring.reshape(lkgs_spring.shape[:2] + (-1, 2))
+        ).reshape(lkgs_spring.shape)
+
+        legs = np.concatenate([lkgs_spring, lkgs_main], axis=-3)
+
+        # Transform based on foot initial and end position
+        legs = helper.transform_points(
+            helper.link_angle(legs[:, [0, -1], -1, 1, :]) - np.pi / 2,
+            0, 0,
+            legs.reshape((n, -1, 2)),
+            inverse=True
+        ).reshape(legs.shape)
+
+    valid = (
+        np.all(valid_main, axis=-1) &
+        np.all(valid_spring, axis=-1) &
+        np.all(valid_torque, axis=-1)
+    )
+
+    return legs, ps_torques, ps_torques_local, valid
+
+
 def mj_params(x, p):
-    result = sim(x, p)
+    # The first keyframe is placed in the foot frame, so only the first and
+    # last keyframes are solved
+    result = sim(x, p, keyframes=[0, -1])
     leg = result['legs'][0]
+    lk_femur = result['femur']
+    # Positions are relative to the knee
+    knee = lk_femur[1]
 
     params = {}
 
-    lk_femur = result['femur']
     l_femur = helper.link_length(lk_femur)
     pitch_femur = helper.link_angle(lk_femur)
-    center_femur = helper.transform_points(
-        pitch_femur, lk_femur[0, 0], lk_femur[0, 1],
-        np.array([[l_femur / 2, 0]]),
-    )[0]
-    params['femur_x'] = center_femur[0] - lk_femur[1, 0]
+    pitch_servo = (
+        pitch_femur +
+        np.arccos(L_SERVO_OFFSET / l_femur) +
+        np.pi
+    )
+    center_femur, center_servo = helper.transform_points(
+        np.array([pitch_femur, pitch_servo]),
+        lk_femur[0, 0], lk_femur[0, 1],
+        np.array([[[l_femur / 2, 0]], [[-L_SERVO_OFFSET, 0]]]),
+    )[:, 0] - knee
+    params['femur_x'] = center_femur[0]
     params['femur_y'] = Y_FEMUR
-    params['femur_z'] = center_femur[1] - lk_femur[1, 1]
+    params['femur_z'] = center_femur[1]
     params['femur_pitch'] = -pitch_femur / np.pi * 180
     params['femur_l'] = l_femur / 2
     params['femur_w'] = H_LINK_THICK / 2
     params['femur_h'] = H_FEMUR / 2
 
-    params['knee_x'] = -lk_femur[1, 0]
-    params['knee_z'] = -lk_femur[1, 1]
+    params['knee_x'] = -knee[0]
+    params['knee_z'] = -knee[1]
 
-    pitch_servo = (
-        pitch_femur +
-        np.arccos(L_SERVO_OFFSET / l_femur) +
-        np.pi
-    )
-    center_servo = helper.transform_points(
-        pitch_servo,
-        lk_femur[0, 0], lk_femur[0, 1],
-        np.array([[-L_SERVO_OFFSET, 0]]),
-    )[0]
-    params['knee_servo_x'] = center_servo[0] - lk_femur[1, 0]
+    params['knee_servo_x'] = center_servo[0]
     params['knee_servo_y'] = Y_SERVO
-    params['knee_servo_z'] = center_servo[1] - lk_femur[1, 1]
+    params['knee_servo_z'] = center_servo[1]
     params['knee_servo_pitch'] = -pitch_servo * 180 / np.pi
     params['knee_servo_l'] = L_SERVO / 2
     params['knee_servo_w'] = W_SERVO / 2
     params['knee_servo_h'] = H_SERVO / 2
 
-    lk_ground = leg[8]
-    l_ground = helper.link_length(lk_ground)
-    pitch_ground = helper.link_angle(lk_ground)
-    center_ground = helper.transform_points(
-        pitch_ground, lk_ground[0, 0], lk_ground[0, 1],
-        np.array([[l_ground / 2, H_LINK_OFFSET]]),
-    )[0]
-    params['ground_x'] = center_ground[0] - lk_femur[1, 0]
-    params['ground_z'] = center_ground[1] - lk_femur[1, 1]
-    params['ground_pitch'] = -pitch_ground * 180 / np.pi
-    params['ground_l'] = l_ground / 2
-    params['ground_w'] = W_LINK / 2
-    params['ground_h'] = H_LINK_TOTAL / 2
-
-    lk_input = leg[0]
-    l_input = helper.link_length(lk_input)
-    pitch_input = helper.link_angle(lk_input)
-    center_input = helper.transform_points(
-        pitch_input, lk_input[0, 0], lk_input[0, 1],
-        np.array([[l_input / 2, H_LINK_OFFSET]]),
-    )[0]
-    params['input_x'] = center_input[0] - lk_femur[1, 0]
-    params['input_y'] = Y_INPUT
-    params['input_z'] = center_input[1] - lk_femur[1, 1]
-    params['input_pitch'] = -pitch_input * 180 / np.pi
-    params['input_l'] = l_input / 2
-    params['input_w'] = W_INPUT / 2
-    params['input_h'] = H_LINK_TOTAL / 2
-
-    lk_crank = leg[5]
-    l_crank = helper.link_length(lk_crank)
-    pitch_crank = helper.link_angle(lk_crank)
-    center_crank = helper.transform_points(
-        pitch_crank, lk_crank[0, 0], lk_crank[0, 1],
-        np.array([[l_crank / 2, -H_LINK_OFFSET]]),
-    )[0]
-    params['crank_x'] = center_crank[0] - lk_femur[1, 0]
-    params['crank_z'] = center_crank[1] - lk_femur[1, 1]
-    params['crank_pitch'] = -pitch_crank * 180 / np.pi
-    params['crank_l'] = l_crank / 2
-    params['crank_w'] = W_LINK / 2
-    params['crank_h'] = H_LINK_TOTAL / 2
-
-    lk_ss = leg[4]
-    l_ss = helper.link_length(lk_ss)
-    pitch_ss = helper.link_angle(lk_ss)
-    center_ss = helper.transform_points(
-        pitch_ss, lk_ss[0, 0], lk_ss[0, 1],
-        np.array([[l_ss / 2, -H_LINK_OFFSET]]),
-    )[0]
-    params['ss_x'] = center_ss[0] - lk_femur[1, 0]
-    params['ss_y'] = Y_INPUT
-    params['ss_z'] = center_ss[1] - lk_femur[1, 1]
-    params['ss_pitch'] = -pitch_ss * 180 / np.pi
-    params['ss_l'] = l_ss / 2
-    params['ss_w'] = W_INPUT / 2
-    params['ss_h'] = H_LINK_TOTAL / 2
-
-    lk_rocker = leg[7]
-    l_rocker = helper.link_length(lk_rocker)
-    pitch_rocker = helper.link_angle(lk_rocker)
-    center_rocker = helper.transform_points(
-        pitch_rocker, lk_rocker[0, 0], lk_rocker[0, 1],
-        np.array([[l_rocker / 2, -H_LINK_OFFSET]]),
-    )[0]
-    params['rocker_x'] = center_rocker[0] - lk_femur[1, 0]
-    params['rocker_z'] = center_rocker[1] - lk_femur[1, 1]
-    params['rocker_pitch'] = -pitch_rocker * 180 / np.pi
-    params['rocker_l'] = l_rocker / 2
-    params['rocker_w'] = W_LINK / 2
-    params['rocker_h'] = H_LINK_TOTAL / 2
-
-    params['rocker_joint_x'] = lk_rocker[1, 0] - lk_femur[1, 0]
-    params['rocker_joint_z'] = lk_rocker[1, 1] - lk_femur[1, 1]
-
-    lk_coupler = np.array([leg[6, 1, :], leg[9, 1, :]])
-    l_coupler = helper.link_length(lk_coupler) - L_FOOT
-    pitch_coupler = helper.link_angle(lk_coupler)
-    center_coupler = helper.transform_points(
-        pitch_coupler, lk_coupler[0, 0], lk_coupler[0, 1],
-        np.array([[l_coupler / 2, H_LINK_OFFSET]]),
-    )[0]
-    params['coupler_x'] = center_coupler[0] - lk_femur[1, 0]
-    params['coupler_z'] = center_coupler[1] - lk_femur[1, 1]
-    params['coupler_pitch'] = -pitch_coupler * 180 / np.pi
-    params['coupler_l'] = l_coupler / 2
-    params['coupler_w'] = W_LINK / 2
-    params['coupler_h'] = H_LINK_TOTAL / 2
-
-    center_foot = helper.transform_points(
-        pitch_coupler, lk_coupler[0, 0], lk_coupler[0, 1],
-        np.array([[l_coupler + L_FOOT / 2, H_LINK_OFFSET]]),
-    )[0]
-    params['foot_x'] = center_foot[0] - lk_femur[1, 0]
-    params['foot_z'] = center_foot[1] - lk_femur[1, 1]
-    params['foot_pitch'] = -pitch_coupler * 180 / np.pi
-    params['foot_l'] = L_FOOT / 2
-    params['foot_w'] = W_LINK / 2
-    params['foot_h'] = H_LINK_TOTAL / 2
-
-    params['coupler_joint_x'] = lk_coupler[0, 0] - lk_femur[1, 0]
-    params['coupler_joint_z'] = lk_coupler[0, 1] - lk_femur[1, 1]
-
-    params['crank_anchor_x'] = leg[6, 0, 0] - lk_femur[1, 0]
-    params['crank_anchor_z'] = leg[6, 0, 1] - lk_femur[1, 1]
-
-    lk_ps = leg[2]
-    l_ps = helper.link_length(lk_ps)
-    pitch_ps = helper.link_angle(lk_ps)
-    center_ps = helper.transform_points(
-        pitch_ps, lk_ps[0, 0], lk_ps[0, 1],
-        np.array([[l_ps / 2, H_LINK_OFFSET]]),
-    )[0]
-    params['ps_x'] = center_ps[0] - lk_femur[1, 0]
-    params['ps_y'] = Y_PS
-    params['ps_z'] = center_ps[1] - lk_femur[1, 1]
-    params['ps_pitch'] = -pitch_ps * 180 / np.pi
-    params['ps_l'] = l_ps / 2
-    params['ps_w'] = W_LINK / 2
-    params['ps_h'] = H_LINK_TOTAL / 2
-
-    params['ps_joint_x'] = lk_ps[1, 0] - lk_femur[1, 0]
-    params['ps_joint_z'] = lk_ps[1, 1] - lk_femur[1, 1]
-
-    lk_ps_coupler = leg[1]
-    l_ps_coupler = helper.link_length(lk_ps_coupler)
-    pitch_ps_coupler = helper.link_angle(lk_ps_coupler)
-    center_ps_coupler = helper.transform_points(
-        pitch_ps_coupler, lk_ps_coupler[0, 0], lk_ps_coupler[0, 1],
-        np.array([[l_ps_coupler / 2, H_LINK_OFFSET]]),
-    )[0]
-    params['ps_coupler_x'] = center_ps_coupler[0] - lk_femur[1, 0]
-    params['ps_coupler_y'] = Y_PS
-    params['ps_coupler_z'] = center_ps_coupler[1] - lk_femur[1, 1]
-    params['ps_coupler_pitch'] = -pitch_ps_coupler * 180 / np.pi
-    params['ps_coupler_l'] = l_ps_coupler / 2
-    params['ps_coupler_w'] = W_LINK / 2
-    params['ps_coupler_h'] = H_LINK_TOTAL / 2
-
-    params['ps_coupler_joint_x'] = lk_ps_coupler[1, 0] - lk_femur[1, 0]
-    params['ps_coupler_joint_z'] = lk_ps_coupler[1, 1] - lk_femur[1, 1]
-
-    params['input_anchor_x'] = leg[1, 0, 0] - lk_femur[1, 0]
-    params['input_anchor_z'] = leg[1, 0, 1] - lk_femur[1, 1]
+    # Links of the leg, and the coupler from the rocker to the foot
+    links = np.concatenate([
+        leg, [[leg[6, 1, :], leg[9, 1, :]]]
+    ])
+    names, indices, sides, ys, widths = zip(*LINK_BOXES)
+    boxes = links[list(indices)]
+    lengths = helper.link_length(boxes)
+    pitches = helper.link_angle(boxes)
+    # The foot is the end of the coupler
+    coupler = names.index('coupler')
+    foot = names.index('foot')
+    lengths[coupler] -= L_FOOT
+    lengths[foot] = L_FOOT
+    starts = np.zeros(len(boxes))
+    starts[foot] = lengths[coupler]
+    centers = helper.transform_points(
+        pitches, boxes[:, 0, 0], boxes[:, 0, 1],
+        np.stack([
+            starts + lengths / 2, np.array(sides) * H_LINK_OFFSET
+        ], axis=-1)[:, None, :],
+    )[:, 0] - knee
+    for name, y, w, center, pitch, length in zip(
+        names, ys, widths, centers, pitches, lengths
+    ):
+        params[f'{name}_x'] = center[0]
+        if y is not None:
+            params[f'{name}_y'] = y
+        params[f'{name}_z'] = center[1]
+        params[f'{name}_pitch'] = -pitch * 180 / np.pi
+        params[f'{name}_l'] = length / 2
+        params[f'{name}_w'] = w / 2
+        params[f'{name}_h'] = H_LINK_TOTAL / 2
+
+    for name, index, end in LINK_JOINTS:
+        params[f'{name}_x'] = links[index, end, 0] - knee[0]
+        params[f'{name}_z'] = links[index, end, 1] - knee[1]
 
     params['ss_k'] = result['ss']
     params['ps_k'] = result['ps']
@@ -33,103 +33,136 @@ CONSTRAINTS_MAX = np.array([
     0.05  # max leg width
 ])
 CONSTRAINTS_WEIGHTS = 10 * np.array([1, 1, 1, 0.04, 1, 1, 1, 1, 1, 1, 1])
+POPSIZE = 10
+SEED_FRACTION = 0.2  # of the population
+SEED_PERTURBATION = 0.02  # of the bounds
+PLATEAU_GENERATIONS = 30
+PLATEAU_TOL = 1e-3
+FEASIBLE_GENERATIONS = 150
 
 
-def obj_with_constraints(x, p, plot=False):
-    result = model.sim(x, p)
-    l_ab, l_bc, l_cd, l_ad, l_be, input_offset, l_ps, l_ss = x
+def obj_with_constraints_batch(X, p, result=None):
+    # Cost (N,) and constraint violations (N, 11) of a population X (N, 8).
+    # Designs that cannot be assembled are flagged in the returned mask
+    # and their rows are undefined.
+    if result is None:
+        result = model.sim_batch(X, p)
+    l_ab, l_bc, l_cd, l_ad, l_be, input_offset, l_ps, l_ss = (
+        np.asarray(X, dtype=float).T
+    )
     travel_offset, travel_length, input_range, parallel_stiffness, series_stiffness = p
+    n = len(l_ab)
 
     has_ps = parallel_stiffness != 0
+    legs = result['legs']
     if not has_ps:
-        result['legs'] = np.array([
-            leg[np.r_[0, 4:len(leg)]]
-            for leg in result['legs']
-        ])
-
-    # Cost
-    l_femur = helper.link_length(result['femur'])
-    l_af = helper.link_length(result['legs'][0][0])
-    l_aj = helper.link_length(result['legs'][0][4])
-    cost_length = np.sum([
-        l_ab, l_bc, l_cd, l_ad, l_be, l_femur,  # main
-        l_af * 2, l_aj  # series spring
-    ])
-    if has_ps:
-        l_fg = helper.link_length(result['legs'][0][1])
-        l_gh = helper.link_length(result['legs'][0][2])
-        l_ah = helper.link_length(result['legs'][0][3])
-        cost_length += np.sum([l_fg, l_gh, l_ah])
-
-    cost = cost_length
-
-    # Constraints
-    constraint_trajectory = np.amax(
-        np.abs((result['feet'] - result['feet_ref']))
-    ) / travel_length
-
-    gap_y = np.array([
-        np.amin(leg.reshape((-1, 2))[:-1, 1] - foot[1])
-        for leg, foot in zip(result['legs'], result['feet'])
-    ])
-    constraint_gap_y = -np.amin(gap_y)
-
-    pts_x = result['legs'].reshape(-1, 2)[:, 0] - result['feet'][0, 0]
-    constraint_centroid_x = np.abs(np.mean(pts_x))
-
-    transmission_angles = np.array([
-        four_bar.transmission_angle(leg[5:9]) if has_ps else
-        four_bar.transmission_angle(leg[2:6])
-        for leg in result['legs']
-    ])
-    constraint_transmission_angle = np.amax(np.pi / 2 - transmission_angles)
-
-    if has_ps:
-        constraint_parallel_stiffness = np.abs(
-            result["ps_torques"][-1] / result["inputs"][-1] -
-            parallel_stiffness
-        ) / parallel_stiffness
-    else:
-        constraint_parallel_stiffness = 0
+        legs = legs[:, :, np.r_[0, 4:legs.shape[2]]]
+    feet = result['feet']
 
-    constraint_series_stiffness = np.abs(
-        result["ss"] - series_stiffness
-    ) / series_stiffness
+    with np.errstate(invalid='ignore'):
+        # Cost
+        l_femur = helper.link_length(result['femur'])
+        l_af = helper.link_length(legs[:, 0, 0])
+        l_aj = helper.link_length(legs[:, 0, 4])
+        cost_length = np.sum(np.stack([
+            l_ab, l_bc, l_cd, l_ad, l_be, l_femur,  # main
+            l_af * 2, l_aj  # series spring
+        ], axis=-1), axis=-1)
+        if has_ps:
+            l_fg = helper.link_length(legs[:, 0, 1])
+            l_gh = helper.link_length(legs[:, 0, 2])
+            l_ah = helper.link_length(legs[:, 0, 3])
+            cost_length += np.sum(np.stack([l_fg, l_gh, l_ah], axis=-1), axis=-1)
 
-    if has_ps:
-        constraint_ps_local_torque = np.amax(
-            np.abs(result['ps_torques_local'])
+        cost = cost_length
+
+        # Constraints
+        constraint_trajectory = np.amax(
+            np.abs((feet - result['feet_ref'])), axis=(1, 2)
+        ) / travel_length
+
+        gap_y = np.amin(
+            legs.reshape(legs.shape[:2] + (-1, 2))[:, :, :-1, 1] -
+            feet[:, :, None, 1],
+            axis=-1
         )
-    else:
-        constraint_ps_local_torque = 0
+        constraint_gap_y = -np.amin(gap_y, axis=-1)
 
-    constraint_min_femur_length = -l_femur
-    constraint_max_femur_length = l_femur
-    if has_ps:
-        constraint_max_ps_coupler_length = l_fg
-    else:
-        constraint_max_ps_coupler_length = 0
-
-    constraint_max_leg_width = np.amax(np.abs([
-        np.amin(pts_x), np.amax(pts_x)
-    ]))
-
-    constraints = np.array([
-        constraint_trajectory,
-        constraint_gap_y,
-        constraint_centroid_x,
-        constraint_transmission_angle,
-        constraint_parallel_stiffness,
-        constraint_series_stiffness,
-        constraint_ps_local_torque,
-        constraint_min_femur_length,
-        constraint_max_femur_length,
-        constraint_max_ps_coupler_length,
-        constraint_max_leg_width
-    ])
-    constraints = np.maximum(constraints, CONSTRAINTS_MAX) - CONSTRAINTS_MAX
+        pts_x = legs.reshape((n, -1, 2))[:, :, 0] - feet[:, :1, 0]
+        constraint_centroid_x = np.abs(np.mean(pts_x, axis=-1))
+
+        transmission_angles = (
+            four_bar.transmission_angle(legs[:, :, 5:9]) if has_ps else
+            four_bar.transmission_angle(legs[:, :, 2:6])
+        )
+        constraint_transmission_angle = np.amax(
+            np.pi / 2 - transmission_angles, axis=-1
+        )
+
+        if has_ps:
+            constraint_parallel_stiffness = np.abs(
+                result["ps_torques"][:, -1] / result["inputs"][-1] -
+                parallel_stiffness
+            ) / parallel_stiffness
+        else:
+            constraint_parallel_stiffness = np.zeros(n)
+
+        constraint_series_stiffness = np.abs(
+            result["ss"] - series_stiffness
+        ) / series_stiffness
+
+        if has_ps:
+            constraint_ps_local_torque = np.amax(
+                np.abs(result['ps_torques_local']), axis=-1
+            )
+        else:
+            constraint_ps_local_torque = np.zeros(n)
+
+        constraint_min_femur_length = -l_femur
+        constraint_max_femur_length = l_femur
+        if has_ps:
+            constraint_max_ps_coupler_length = l_fg
+        else:
+            constraint_max_ps_coupler_length = np.zeros(n)
+
+        constraint_max_leg_width = np.maximum(
+            np.abs(np.amin(pts_x, axis=-1)), np.abs(np.amax(pts_x, axis=-1))
+        )
+
+        constraints = np.stack([
+            constraint_trajectory,
+            constraint_gap_y,
+            constraint_centroid_x,
+            constraint_transmission_angle,
+            constraint_parallel_stiffness,
+            constraint_series_stiffness,
+            constraint_ps_local_torque,
+            constraint_min_femur_length,
+            constraint_max_femur_length,
+            constraint_max_ps_coupler_length,
+            constraint_max_leg_width
+        ], axis=-1)
+        constraints = (
+            np.maximum(constraints, CONSTRAINTS_MAX) - CONSTRAINTS_MAX
+        )
+
+    return cost, constraints, result['valid']
+
+
+def obj_with_constraints(x, p, plot=False):
+    result = model.sim_batch(np.array([x]), p)
+    assert result['valid'][0], 'Invalid geometry'
+    cost, constraints, _ = obj_with_constraints_batch(
+        np.array([x]), p, result=result
+    )
+    cost = cost[0]
+    constraints = constraints[0]
 
     if plot:
+        result = model.unbatch(result, 0)
+        if p[3] == 0:
+            result['legs'] = result['legs'][:, np.r_[0, 4:10]]
+
         print('x: ', ', '.join([f'{c:.5f}' for c in x]))
         print('p: ', ', '.join([f'{c:.2f}' for c in p]))
         print(f'cost: {cost:.3f}')
@@ -153,26 +186,113 @@ def obj_with_constraints(x, p, plot=False):
 
 
 def obj(x, p, plot=False):
-    try:
-        cost, constraints = obj_with_constraints(x, p, plot=plot)
-    except AssertionError:
-        return 10
-    return cost + np.sum(CONSTRAINTS_WEIGHTS * constraints)
+    if plot:
+        try:
+            obj_with_constraints(x, p, plot=plot)
+        except AssertionError:
+            pass
+    return obj_batch(np.array([x]), p)[0]
+
 
+def obj_batch(X, p):
+    # Objective of a population X (N, 8). Invalid geometry is penalized
+    # through the mask instead of raising for each member.
+    cost, constraints, valid = obj_with_constraints_batch(X, p)
+    return np.where(
+        valid,
+        cost + np.sum(CONSTRAINTS_WEIGHTS * constraints, axis=-1),
+        10
+    )
+
+
+def obj_vectorized(x, p):
+    # differential_evolution passes the population as (8, N)
+    return obj_batch(x.T, p)
 
-def optimize(p, seed=None):
+
+class ConvergenceMonitor():
+    # differential_evolution callback that stops a run once the best member
+    # is feasible and its cost has plateaued, or gives up on a run where no
+    # best member has been feasible by FEASIBLE_GENERATIONS
+    def __init__(self, p):
+        self.p = p
+        self.costs = []
+        self.feasible_found = False
+        self.infeasible = False
+
+    def __call__(self, intermediate_result):
+        self.costs.append(intermediate_result.fun)
+        _, constraints, valid = obj_with_constraints_batch(
+            np.array([intermediate_result.x]), self.p
+        )
+        feasible = valid[0] and np.sum(constraints[0]) == 0
+        self.feasible_found = self.feasible_found or feasible
+
+        if not self.feasible_found:
+            self.infeasible = len(self.costs) >= FEASIBLE_GENERATIONS
+            return self.infeasible
+
+        return bool(
+            feasible and
+            len(self.costs) > PLATEAU_GENERATIONS and
+            self.costs[-1 - PLATEAU_GENERATIONS] - self.costs[-1] <=
+            PLATEAU_TOL
+        )
+
+
+def init_population(x_seeds, seed=None):
+    # Latin hypercube population whose first members are the seed solutions
+    # followed by small perturbations of them
+    bounds = np.array(BOUNDS)
+    num_members = POPSIZE * len(BOUNDS)
+    rng = np.random.default_rng(seed)
+    population = (
+        rng.permuted(
+            np.tile(np.arange(num_members), (len(BOUNDS), 1)), axis=1
+        ).T +
+        rng.random((num_members, len(BOUNDS)))
+    ) / num_members
+    population = bounds[:, 0] + population * (bounds[:, 1] - bounds[:, 0])
+
+    x_seeds = np.atleast_2d(x_seeds)
+    num_seeds = max(len(x_seeds), int(SEED_FRACTION * num_members))
+    seeds = x_seeds[np.arange(num_seeds) % len(x_seeds)]
+    seeds[len(x_seeds):] += rng.normal(
+        scale=SEED_PERTURBATION * (bounds[:, 1] - bounds[:, 0]),
+        size=(num_seeds - len(x_seeds), len(BOUNDS))
+    )
+    population[:num_seeds] = np.clip(seeds, bounds[:, 0], bounds[:, 1])
+
+    return population
+
+
+def optimize(
+    p,
+    seed=None,
+    vectorized=False,
+    workers=-1,
+    x_seeds=None,
+    early_stop=False
+):
     assert p[0] + p[1] < MAX_LEG_LENGTH + 1e-4
+    if x_seeds is not None and len(x_seeds) > 0:
+        init = init_population(x_seeds, seed=seed)
+    else:
+        init = 'latinhypercube'
     return differential_evolution(
-        obj,
+        obj_vectorized if vectorized else obj,
         args=(p,),
         bounds=BOUNDS,
-        popsize=10,
+        popsize=POPSIZE,
+        init=init,
         maxiter=500,
         tol=0.01,
-        workers=-1,
+        workers=1 if vectorized else workers,
         updating='deferred',
+        vectorized=vectorized,
         polish=False,
-        seed=seed
+        seed=seed,
+        callback=ConvergenceMonitor(p) if early_stop else None
     )
 
 
@@ -181,7 +301,7 @@ if __name__ == '__main__':
     for i in range(5):
         print(f'trial: {i}')
         try:
-            r = optimize(p)
+            r = optimize(p, early_stop=True)
             cost, constraints = obj_with_constraints(r.x, p)
             valid = np.sum(constraints) == 0
         except AssertionError:
@@ -1,8 +1,10 @@
 import os
 import shutil
 import argparse
+import json
 import time
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from leg import opt
 
@@ -11,11 +13,128 @@ PARAMS_STEP = np.array([0.02, 0.02, 0.3, 0.1, 0.4])
 CANDIDATE_START = [0, 0, 0, 0, 0]
 MAX_STEPS = 50000
 KEYPOINT_FREQUENCY = 1000
+SNAPSHOT_FREQUENCY = 100
 TRACK_FREQUENCY = 10
+JOURNAL_NAME = 'journal.jsonl'
 DIRECTIONS = np.concatenate([np.eye(5), -np.eye(5)]).astype(int)
 
 
-def search(name=None, track=False, checkpoint=None):
+def key(candidate):
+    return tuple(int(c) for c in candidate)
+
+
+def known_keys(candidates, valids):
+    # A design point, once queued, stays either in candidates, under
+    # evaluation or in valids, so the set of known points only grows.
+    return set(key(c) for c in candidates) | set(key(c) for c in valids)
+
+
+def expand(candidates, valids, legs, known, candidate, valid, leg):
+    # Update the search with the outcome of one design point
+    if valid:
+        valids.append(candidate)
+        new_candidates = np.array(candidate) + DIRECTIONS
+        new_candidates = new_candidates[np.all(new_candidates >= 0, axis=1)]
+        for new_candidate in new_candidates:
+            new_key = key(new_candidate)
+            if new_key not in known:
+                known.add(new_key)
+                candidates.append(list(new_key))
+
+        legs.append(leg)
+    else:
+        candidates.appendleft(candidate)
+
+
+def neighbour_solutions(candidate, solved):
+    # Solutions of the already valid design points one step away
+    return np.array([
+        solved[k]
+        for k in map(key, np.array(candidate) + DIRECTIONS)
+        if k in solved
+    ])
+
+
+def evaluate(
+    candidate,
+    workers=-1,
+    vectorized=False,
+    x_seeds=None,
+    early_stop=True
+):
+    p = np.array(candidate) * PARAMS_STEP + PARAMS_START
+    try:
+        r = opt.optimize(
+            p,
+            workers=workers,
+            vectorized=vectorized,
+            x_seeds=x_seeds,
+            early_stop=early_stop
+        )
+        cost, constraints = opt.obj_with_constraints(r.x, p)
+        valid = np.sum(constraints) == 0
+    except AssertionError:
+        valid = False
+
+    return p, valid, np.concatenate([r.x, p]) if valid else None
+
+
+def save_snapshot(folder_name, checkpoint):
+    # Compact the journal into the snapshot. The snapshot is replaced
+    # atomically before the journal is truncated, so a crash in between
+    # leaves records that replay skips by step.
+    path = os.path.join(folder_name, 'checkpoint.npy')
+    np.save(path + '.tmp.npy', checkpoint)
+    os.replace(path + '.tmp.npy', path)
+    open(os.path.join(folder_name, JOURNAL_NAME), 'w').close()
+
+
+def load_checkpoint(path):
+    # Load a snapshot and replay the journal next to it, if it continues
+    # from the snapshot step
+    checkpoint = np.load(path, allow_pickle=True).item()
+    journal_path = os.path.join(os.path.dirname(path), JOURNAL_NAME)
+    if not os.path.exists(journal_path):
+        return checkpoint
+
+    known = known_keys(checkpoint['candidates'], checkpoint['valids'])
+    with open(journal_path, 'r') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # partially written last record
+            if record['step'] <= checkpoint['step']:
+                continue
+            if record['step'] != checkpoint['step'] + 1:
+                break
+
+            candidate = record['candidate']
+            checkpoint['candidates'].remove(candidate)
+            expand(
+                checkpoint['candidates'],
+                checkpoint['valids'],
+                checkpoint['legs'],
+                known,
+                candidate,
+                record['valid'],
+                np.array(record['leg']) if record['valid'] else None
+            )
+            checkpoint['step'] = record['step']
+
+    return checkpoint
+
+
+def search(
+    name=None,
+    track=False,
+    checkpoint=None,
+    num_parallel=1,
+    num_workers=None,
+    vectorized=False,
+    warm_start=True,
+    early_stop=True
+):
     if checkpoint is not None and name is None:
         actual_name = checkpoint['name']
     elif name is None:
@@ -55,56 +174,86 @@ def search(name=None, track=False, checkpoint=None):
         valids = checkpoint['valids']
         legs = checkpoint['legs']
         step = checkpoint['step']
+    known = known_keys(candidates, valids)
+    # Solved designs to warm start the optimization of their neighbours
+    solved = {key(c): leg[:8] for c, leg in zip(valids, legs)}
 
-    step_init = step
-    start_time = time.time()
-
-    while len(candidates) > 0 and step < MAX_STEPS:
-        candidate = candidates.pop()
-        p = np.array(candidate) * PARAMS_STEP + PARAMS_START
-        try:
-            step += 1
-            r = opt.optimize(p)
-            cost, constraints = opt.obj_with_constraints(r.x, p)
-            valid = np.sum(constraints) == 0
-        except AssertionError:
-            valid = False
-
-        if valid:
-            valids.append(candidate)
-            for dir in DIRECTIONS:
-                new_candidate_array = np.array(candidate) + dir
-                new_candidate_list = list(new_candidate_array)
-                if (
-                    new_candidate_list not in valids and
-                    new_candidate_list not in candidates and
-                    np.all(new_candidate_array >= 0)
-                ):
-                    candidates.append(new_candidate_list)
-
-            legs.append(np.concatenate([r.x, p]))
-        else:
-            candidates.insert(0, candidate)
+    # Design points under evaluation, in the order they were popped
+    pending = deque()
+    if num_workers is None:
+        # Split the cores between the concurrent optimizations
+        num_workers = (
+            -1 if num_parallel == 1 else
+            max(1, os.cpu_count() // num_parallel)
+        )
+    pool = ProcessPoolExecutor(num_parallel) if num_parallel > 1 else None
 
-        checkpoint = {
+    def make_checkpoint():
+        # Design points under evaluation are put back to be popped first
+        return {
             'name': actual_name,
             'track_id': wandb.run.id if track else None,
             'step': step,
-            'candidates': candidates,
+            'candidates': deque(
+                list(candidates) + [c for c, _ in reversed(pending)]
+            ),
             'valids': valids,
             'legs': legs,
             'params_start': PARAMS_START,
             'params_step': PARAMS_STEP
         }
-        np.save(
-            os.path.join(folder_name, 'checkpoint.npy'),
-            checkpoint
-        )
+
+    # Start a fresh journal on top of the current state
+    save_snapshot(folder_name, make_checkpoint())
+    journal = open(os.path.join(folder_name, JOURNAL_NAME), 'a')
+
+    step_init = step
+    start_time = time.time()
+
+    while (len(candidates) > 0 or len(pending) > 0) and step < MAX_STEPS:
+        while (
+            len(candidates) > 0 and
+            len(pending) < num_parallel and
+            step + len(pending) < MAX_STEPS
+        ):
+            candidate = candidates.pop()
+            x_seeds = (
+                neighbour_solutions(candidate, solved) if warm_start else None
+            )
+            args = (candidate, num_workers, vectorized, x_seeds, early_stop)
+            if pool is None:
+                result = evaluate(*args)
+            else:
+                result = pool.submit(evaluate, *args)
+            pending.append((candidate, result))
+
+        # Results are merged in the order the candidates were popped, so the
+        # journal does not depend on which optimization finishes first
+        candidate, result = pending.popleft()
+        p, valid, leg = result if pool is None else result.result()
+        step += 1
+        expand(candidates, valids, legs, known, candidate, valid, leg)
+        if valid:
+            solved[key(candidate)] = leg[:8]
+
+        # One record per design point keeps the checkpoint cost constant
+        journal.write(json.dumps({
+            'step': step,
+            'candidate': [int(c) for c in candidate],
+            'valid': bool(valid),
+            'leg': leg.tolist() if valid else None
+        }) + '\n')
+        journal.flush()
+
+        if step % SNAPSHOT_FREQUENCY == 0:
+            journal.close()
+            save_snapshot(folder_name, make_checkpoint())
+            journal = open(os.path.join(folder_name, JOURNAL_NAME), 'a')
 
         if step % KEYPOINT_FREQUENCY == 0:
             checkpoint_name = f'checkpoint_{step}.npy'
             checkpoint_path = os.path.join(folder_name, checkpoint_name)
-            np.save(checkpoint_path, checkpoint)
+            np.save(checkpoint_path, make_checkpoint())
             if track:
                 shutil.copyfile(
                     checkpoint_path,
@@ -129,6 +278,11 @@ def search(name=None, track=False, checkpoint=None):
                 'search/SPS': sps
             })
 
+    journal.close()
+    save_snapshot(folder_name, make_checkpoint())
+    if pool is not None:
+        pool.shutdown()
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -139,12 +293,28 @@ if __name__ == '__main__':
         action=argparse.BooleanOptionalAction
     )
     parser.add_argument('--checkpoint', type=str, default=None)
+    parser.add_argument('--num_parallel', type=int, default=1)
+    parser.add_argument('--num_workers', type=int, default=None)
+    parser.add_argument(
+        '--vectorized',
+        default=False,
+        action=argparse.BooleanOptionalAction
+    )
+    parser.add_argument(
+        '--warm_start',
+        default=True,
+        action=argparse.BooleanOptionalAction
+    )
+    parser.add_argument(
+        '--early_stop',
+        default=True,
+        action=argparse.BooleanOptionalAction
+    )
     args = vars(parser.parse_args())
 
     if args['checkpoint'] is not None:
-        args['checkpoint'] = np.load(
-            os.path.join('logs', args['checkpoint']),
-            allow_pickle=True
-        ).item()
+        args['checkpoint'] = load_checkpoint(
+            os.path.join('logs', args['checkpoint'])
+        )
 
     search(**args)
@@ -0,0 +1,80 @@
+import os
+import hashlib
+import json
+import threading
+import numpy as np
+from leg import model
+
+# Bump when model.mj_params changes its output for the same constants
+VERSION = 1
+CHECKPOINT_PATH = os.path.join('data', 'leg_checkpoint.npy')
+
+
+def load_legs(checkpoint_path=CHECKPOINT_PATH):
+    return np.array(np.load(
+        checkpoint_path, allow_pickle=True
+    ).item()['legs'])
+
+
+def model_constants():
+    # Module level constants of leg.model, which mj_params depends on
+    return {
+        k: float(v) for k, v in sorted(vars(model).items())
+        if k.isupper() and isinstance(v, (int, float, np.floating))
+    }
+
+
+def table_key(checkpoint_path=CHECKPOINT_PATH):
+    h = hashlib.sha1()
+    h.update(str(VERSION).encode())
+    h.update(json.dumps(model_constants()).encode())
+    with open(checkpoint_path, 'rb') as file:
+        h.update(file.read())
+    return h.hexdigest()[:16]
+
+
+def table_paths(key):
+    path = os.path.join('logs', 'leg', f'mj_params_{key}')
+    return path + '.npy', path + '.json'
+
+
+def make_table(checkpoint_path=CHECKPOINT_PATH):
+    # mj_params of every leg of the checkpoint as rows of a float array,
+    # with the column names in a json file next to it. The key in the file
+    # names changes with the checkpoint and the model constants, so stale
+    # tables are never read. Workers that race to create the same table
+    # write identical content, and the files are replaced atomically.
+    key = table_key(checkpoint_path=checkpoint_path)
+    values_path, names_path = table_paths(key)
+    if not os.path.exists(values_path) or not os.path.exists(names_path):
+        os.makedirs(os.path.dirname(values_path), exist_ok=True)
+        legs = load_legs(checkpoint_path=checkpoint_path)
+        rows = [model.mj_params(leg[:8], leg[8:]) for leg in legs]
+        names = list(rows[0].keys())
+        values = np.array([[row[k] for k in names] for row in rows])
+
+        tmp = f'.{os.getpid()}_{threading.get_ident()}.tmp'
+        np.save(values_path + tmp + '.npy', values)
+        with open(names_path + tmp, 'w') as file:
+            json.dump(names, file)
+        os.replace(names_path + tmp, names_path)
+        os.replace(values_path + tmp + '.npy', values_path)
+    return values_path, names_path
+
+
+class MjParamsTable():
+    # mj_params of the checkpoint legs, memory mapped from disk, so the
+    # pages are shared by all workers and no kinematics runs on reset
+    def __init__(self, checkpoint_path=CHECKPOINT_PATH):
+        values_path, names_path = make_table(checkpoint_path=checkpoint_path)
+        with open(names_path, 'r') as file:
+            self.names = json.load(file)
+        self.columns = {k: i for i, k in enumerate(self.names)}
+        self.values = np.load(values_path, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, leg_index):
+        # Same dict as model.mj_params of the leg
+        return dict(zip(self.names, self.values[leg_index].tolist()))
@@ -1,24 +1,64 @@
 import sys
+import functools
+import multiprocessing as mp
+from multiprocessing import shared_memory
 import numpy as np
 import gymnasium as gym
+from gymnasium.error import AlreadyPendingCallError, NoAsyncCallError
+from gymnasium.vector.async_vector_env import AsyncState
 from gymnasium.vector.utils import write_to_shared_memory
+from rl.threaded_vec_env import ThreadedVectorEnv
 
 
 class ChunkedVectorEnv(gym.vector.AsyncVectorEnv):
-    def __init__(self, env_fn, num_async_vec_envs, num_sync_vec_envs):
+    def __init__(
+        self,
+        env_fn,
+        num_async_vec_envs,
+        num_sync_vec_envs,
+        num_threads=None
+    ):
+        # With num_threads, the envs of each process are stepped in a
+        # thread pool instead of one after another
         def make_sync_env():
+            if num_threads is not None:
+                return ThreadedVectorEnv(
+                    [env_fn for i in range(num_sync_vec_envs)],
+                    num_threads=num_threads
+                )
             return gym.vector.SyncVectorEnv(
                 [env_fn for i in range(num_sync_vec_envs)]
             )
 
+        # Step results are written by the workers into shared buffers of
+        # (num_async_vec_envs, num_sync_vec_envs, ...)
+        env = env_fn()
+        observation_space = env.observation_space
+        env.close()
+        self.buffers, self.buffer_memories, buffer_specs = _create_buffers(
+            [
+                ('reward', (), np.float64),
+                ('terminated', (), np.bool_),
+                ('truncated', (), np.bool_),
+                (
+                    'final_observation',
+                    observation_space.shape, observation_space.dtype
+                ),
+            ],
+            (num_async_vec_envs, num_sync_vec_envs)
+        )
+
         super().__init__(
             [make_sync_env for i in range(num_async_vec_envs)],
-            worker=_worker_shared_memory
+            worker=functools.partial(
+                _worker_shared_memory, buffer_specs=buffer_specs
+            )
         )
 
         self.num_async_vec_envs = num_async_vec_envs
         self.num_sync_vec_envs = num_sync_vec_envs
         self.num_total_envs = num_async_vec_envs * num_sync_vec_envs
+        self.chunks_waiting = np.zeros(num_async_vec_envs, dtype=bool)
 
     def reset(self, seed=None, options=None):
         if not options:
@@ -36,80 +76,168 @@ class ChunkedVectorEnv(gym.vector.AsyncVectorEnv):
             self._flatten_info(info)
         )
 
-    def step(self, action):
-        action = action.reshape(
-            self.num_async_vec_envs, self.num_sync_vec_envs, -1
+    def step_async(self, actions, chunks=slice(None)):
+        # Send the actions of the envs in chunks, a slice of the async envs.
+        # Chunks can be sent while others are still stepping, and each is
+        # collected with step_wait, to overlap the policy with the workers.
+        self._assert_is_running()
+        chunks = np.arange(self.num_async_vec_envs)[chunks]
+        if (
+            self._state != AsyncState.DEFAULT and
+            not np.any(self.chunks_waiting)
+        ) or np.any(self.chunks_waiting[chunks]):
+            raise AlreadyPendingCallError(
+                'Calling `step_async` while waiting for a pending call to '
+                f'`{self._state.value}` to complete.',
+                self._state.value,
+            )
+
+        actions = np.asarray(actions).reshape(
+            len(chunks), self.num_sync_vec_envs, -1
         )
-        obs, reward, terminated, truncated, info = super().step(action)
+        for i, action in zip(chunks, actions):
+            self.parent_pipes[i].send(('step', action))
+        self.chunks_waiting[chunks] = True
+        self._state = AsyncState.WAITING_STEP
+
+    def step_wait(self, timeout=None, chunks=slice(None)):
+        # Results of the envs in chunks, read from the shared buffers. The
+        # pipes carry only the infos, which are empty unless an episode
+        # ended.
+        self._assert_is_running()
+        chunks = np.arange(self.num_async_vec_envs)[chunks]
+        if not np.all(self.chunks_waiting[chunks]):
+            raise NoAsyncCallError(
+                'Calling `step_wait` without any prior call to `step_async`.',
+                AsyncState.WAITING_STEP.value,
+            )
+
+        if timeout is not None and not all(
+            self.parent_pipes[i].poll(timeout) for i in chunks
+        ):
+            raise mp.TimeoutError(
+                f'The call to `step_wait` has timed out after {timeout} '
+                'second(s).'
+            )
+
+        child_info = np.full(len(chunks), None, dtype=object)
+        has_info = np.zeros(len(chunks), dtype=bool)
+        successes = [True] * self.num_async_vec_envs
+        for k, i in enumerate(chunks):
+            info, successes[i] = self.parent_pipes[i].recv()
+            if successes[i] and info:
+                child_info[k] = info['child_info']
+                has_info[k] = True
+        self.chunks_waiting[chunks] = False
+        if not np.any(self.chunks_waiting):
+            self._state = AsyncState.DEFAULT
+        self._raise_if_errors(successes)
+
+        info = {}
+        if np.any(has_info):
+            info = self._flatten_info({
+                'child_info': child_info, '_child_info': has_info
+            })
+        # Indexing with chunks copies, so the next step cannot overwrite
+        # the results
+        terminated = self.buffers['terminated'][chunks].reshape(-1)
+        truncated = self.buffers['truncated'][chunks].reshape(-1)
+        done = np.logical_or(terminated, truncated)
+        if np.any(done):
+            # Rows of the envs that did not finish are stale
+            info['final_observation'] = self.buffers['final_observation'][
+                chunks
+            ].reshape(len(done), -1)
+            info['_final_observation'] = done
         return (
-            obs.reshape(self.num_total_envs, -1),
-            reward.reshape(-1),
-            terminated.reshape(-1),
-            truncated.reshape(-1),
-            self._flatten_info(info)
+            self.observations[chunks].reshape(len(done), -1),
+            self.buffers['reward'][chunks].reshape(-1),
+            terminated,
+            truncated,
+            info
         )
 
+    def close_extras(self, timeout=None, terminate=False):
+        if not terminate and np.any(self.chunks_waiting):
+            self.step_wait(
+                timeout=timeout, chunks=np.flatnonzero(self.chunks_waiting)
+            )
+        super().close_extras(timeout=timeout, terminate=terminate)
+        self.buffers = None
+        for memory in self.buffer_memories:
+            memory.close()
+            memory.unlink()
+        self.buffer_memories = []
+
     def _flatten_info(self, info):
+        # Infos of the chunks merged into arrays over their envs, with False
+        # or None for the envs without the key. Chunks send no info unless
+        # an episode ended, so most steps return here.
         if not info:
             return info
 
-        def get_pads(dtype, length):
-            if dtype == 'bool':
-                return [False] * length
-            else:
-                return [None] * length
-
+        num_envs = len(info['_child_info']) * self.num_sync_vec_envs
         flattened_info = {}
-        for i, single_info in enumerate(info['child_info']):
-            if single_info is None:
-                continue
-
-            for k, v in single_info.items():
+        for i in np.flatnonzero(info['_child_info']):
+            envs = slice(
+                i * self.num_sync_vec_envs, (i + 1) * self.num_sync_vec_envs
+            )
+            for k, v in info['child_info'][i].items():
                 if k not in flattened_info:
-                    if i == 0:
-                        flattened_info[k] = v
+                    if v.dtype == bool:
+                        flattened_info[k] = np.zeros(num_envs, dtype=bool)
                     else:
-                        flattened_info[k] = np.concatenate([
-                            get_pads(v.dtype, i * self.num_sync_vec_envs),
-                            v
-                        ])
-                else:
-                    if i * self.num_sync_vec_envs == len(flattened_info[k]):
-                        flattened_info[k] = np.concatenate([
-                            flattened_info[k],
-                            v
-                        ])
-                    else:
-                        flattened_info[k] = np.concatenate([
-                            flattened_info[k],
-                            get_pads(
-                                v.dtype,
-                                i * self.num_sync_vec_envs -
-                                len(flattened_info[k])
-                            ),
-                            v
-                        ])
-
-        for has_info in info['_child_info'][::-1]:
-            if has_info:
-                break
-
-            for k, v in flattened_info.items():
-                flattened_info[k] = np.concatenate([
-                    v,
-                    get_pads(v.dtype, self.num_sync_vec_envs)
-                ])
+                        flattened_info[k] = np.full(
+                            num_envs, None, dtype=object
+                        )
+                flattened_info[k][envs] = v
 
         return flattened_info
 
 
+def _create_buffers(fields, shape):
+    # Arrays in shared memory, given as (name, shape, dtype) and prefixed
+    # with shape. The specs are passed to the workers to attach them.
+    buffers = {}
+    memories = []
+    specs = []
+    for name, field_shape, dtype in fields:
+        field_shape = tuple(shape) + tuple(field_shape)
+        dtype = np.dtype(dtype)
+        memory = shared_memory.SharedMemory(
+            create=True,
+            size=max(int(np.prod(field_shape)) * dtype.itemsize, 1)
+        )
+        buffers[name] = np.ndarray(
+            field_shape, dtype=dtype, buffer=memory.buf
+        )
+        memories.append(memory)
+        specs.append((name, memory.name, field_shape, dtype.str))
+    return buffers, memories, specs
+
+
+def _attach_buffers(specs):
+    buffers = {}
+    memories = []
+    for name, memory_name, field_shape, dtype in specs:
+        memory = shared_memory.SharedMemory(name=memory_name)
+        buffers[name] = np.ndarray(
+            field_shape, dtype=dtype, buffer=memory.buf
+        )
+        memories.append(memory)
+    return buffers, memories
+
+
 def _worker_shared_memory(
     index, env_fn, pipe, parent_pipe, shared_memory, error_queue,
+    buffer_specs=None
 ):
     assert shared_memory is not None
+    assert buffer_specs is not None
     env = env_fn()
     observation_space = env.observation_space
     parent_pipe.close()
+    buffers, buffer_memories = _attach_buffers(buffer_specs)
     try:
         while True:
             command, data = pipe.recv()
@@ -136,6 +264,16 @@ def _worker_shared_memory(
                     truncated,
                     info,
                 ) = env.step(data)
+                buffers['reward'][index] = reward
+                buffers['terminated'][index] = terminated
+                buffers['truncated'][index] = truncated
+                # Final observations go into the shared buffer, and only
+                # the rest of the info is sent
+                if '_final_observation' in info:
+                    done = info.pop('_final_observation')
+                    buffers['final_observation'][index][done] = np.stack(
+                        info.pop('final_observation')[done]
+                    )
                 # Add a key to enable info stacking
                 if info:
                     info = {'child_info': info}
@@ -148,8 +286,7 @@ def _worker_shared_memory(
                 write_to_shared_memory(
                     observation_space, index, observation, shared_memory
                 )
-                pipe.send(
-                    ((None, reward, terminated, truncated, info), True))
+                pipe.send((info, True))
             elif command == "seed":
                 # Probably not used
                 env.seed(data)
@@ -193,6 +330,9 @@ def _worker_shared_memory(
         error_queue.put((index,) + sys.exc_info()[:2])
         pipe.send((None, False))
     finally:
+        buffers = None
+        for memory in buffer_memories:
+            memory.close()
         env.close()
 
 
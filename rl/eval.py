@@ -12,6 +12,7 @@ from rl.analyze import key_metrics
 
 def eval_single_leg_fully(leg_index, num_trials=100):
     env = Env()
+    env.record_states()
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     checkpoint = torch.load(
         os.path.join('data', 'rl_checkpoint.pt'),
@@ -41,7 +42,6 @@ def eval_single_leg_fully(leg_index, num_trials=100):
         for _ in range(num_trials):
             env.curriculum_cells = [[cell]]
             obs, info = env.reset(options={'leg_index': leg_index})
-            states = []
             for _ in range(num_steps):
                 obs = torch.Tensor(obs).to(device)
                 with torch.no_grad():
@@ -49,26 +49,24 @@ def eval_single_leg_fully(leg_index, num_trials=100):
                 obs, reward, terminated, truncated, info = env.step(
                     action.cpu().numpy()
                 )
-                states.append(env.get_states())
                 if terminated or truncated:
                     break
             env.close()
-            states = np.array(states)
-            states = states[index_start:, :]
-            t = states[:, 0]
-            q = states[:, 3:11]
-            dq = states[:, 11:19]
-            g = states[:, 19:22]
-            w = states[:, 22:25]
-            a = states[:, 25:33]
-            v = states[:, 36:39]
-            tau = states[:, 39:47]
+            states = env.states[index_start:]
+            t = states['t']
+            q = states['q']
+            dq = states['dq']
+            g = states['g']
+            w = states['w']
+            a = states['a']
+            v = states['v']
+            tau = states['tau']
 
             p = np.sum((tau * dq).clip(min=0), axis=1)
             vx = v[:, 0]
             m = env.model.body('body').subtreemass[0]
             cot = np.mean(p) / m / 9.81 / np.abs(np.mean(vx))
-            score = np.mean(np.array(env.rewards[0])[index_start:])
+            score = np.mean(env.rewards[index_start:, 0])
             tau = np.sum(np.abs(tau), axis=1)
 
             v_cmd = np.array([env.vx_cmd, 0, 0])
@@ -103,6 +101,7 @@ def eval_single_leg_fully(leg_index, num_trials=100):
 
 def eval_single_leg(leg_index, num_trials=100):
     env = Env()
+    env.record_states()
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     checkpoint = torch.load(
         os.path.join('data', 'rl_checkpoint.pt'),
@@ -128,7 +127,6 @@ def eval_single_leg(leg_index, num_trials=100):
         for _ in range(num_trials):
             env.curriculum_cells = [[cell]]
             obs, info = env.reset(options={'leg_index': leg_index})
-            states = []
             for _ in range(num_steps):
                 obs = torch.Tensor(obs).to(device)
                 with torch.no_grad():
@@ -136,26 +134,24 @@ def eval_single_leg(leg_index, num_trials=100):
                 obs, reward, terminated, truncated, info = env.step(
                     action.cpu().numpy()
                 )
-                states.append(env.get_states())
                 if terminated or truncated:
                     break
             env.close()
-            states = np.array(states)
-            states = states[index_start:, :]
-            t = states[:, 0]
-            q = states[:, 3:11]
-            dq = states[:, 11:19]
-            g = states[:, 19:22]
-            w = states[:, 22:25]
-            a = states[:, 25:33]
-            v = states[:, 36:39]
-            tau = states[:, 39:47]
+            states = env.states[index_start:]
+            t = states['t']
+            q = states['q']
+            dq = states['dq']
+            g = states['g']
+            w = states['w']
+            a = states['a']
+            v = states['v']
+            tau = states['tau']
 
             p = np.sum((tau * dq).clip(min=0), axis=1)
             vx = v[:, 0]
             m = env.model.body('body').subtreemass[0]
             cot = np.mean(p) / m / 9.81 / np.abs(np.mean(vx))
-            score = np.mean(np.array(env.rewards[0])[index_start:])
+            score = np.mean(env.rewards[index_start:, 0])
             tau = np.sum(np.abs(tau), axis=1)
 
             v_cmd = np.array([env.vx_cmd, 0, 0])
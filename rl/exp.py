@@ -11,6 +11,7 @@ if __name__ == "__main__":
     vx_cmd = float(sys.argv[2])
     wz_cmd = float(sys.argv[3])
     record = 'r' in sys.argv
+    save = 's' in sys.argv
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     checkpoint = torch.load(
@@ -30,9 +31,9 @@ if __name__ == "__main__":
     ).to(device)
     agent.load_state_dict(checkpoint['agent'])
     agent.eval()
+    env.record_states()
 
     frames = []
-    states = []
     obs, info = env.reset(options={
         'leg_index': int(leg_index),
         'vx_cmd': vx_cmd,
@@ -47,7 +48,6 @@ if __name__ == "__main__":
         )
         if record:
             frames.append(env.render())
-        states.append(env.get_states())
         if terminated or truncated:
             print(info)
             break
@@ -60,16 +60,20 @@ if __name__ == "__main__":
             f'env_{leg_index:d}_{vx_cmd:.1f}_{wz_cmd:.1f}.mp4'
         )
 
-    states = np.array(states)
-    t = states[:, 0]
-    v = states[:, 36:39]
-    w = states[:, 22:25]
-    q = states[:, 3:11]
-    dq = states[:, 11:19]
-    g = states[:, 19:22]
-    w = states[:, 22:25]
-    a = states[:, 25:33]
-    tau = states[:, 39:47]
+    if save:
+        env.recorder.save(os.path.join(
+            'logs', 'rl', f'states_{leg_index:d}_{vx_cmd:.1f}_{wz_cmd:.1f}.npy'
+        ))
+
+    states = env.states
+    t = states['t']
+    v = states['v']
+    w = states['w']
+    q = states['q']
+    dq = states['dq']
+    g = states['g']
+    a = states['a']
+    tau = states['tau']
 
     plt.figure()
     plt.subplot(211)
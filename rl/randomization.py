@@ -0,0 +1,98 @@
+import numpy as np
+import mujoco
+
+SERVO_JOINTS = [
+    f'{j}_{l}' for j in ['hip', 'knee'] for l in ['fl', 'fr', 'rl', 'rr']
+]
+# Compiled model destinations of each randomized parameter, as
+# (field, element names or None for all, column or None, scale)
+DOMAIN_RANDOMIZATION = {
+    'friction_tan': [('geom_friction', None, 0, 1)],
+    'servo_k': [
+        ('actuator_gainprm', None, 0, 1),
+        ('actuator_biasprm', None, 1, -1)
+    ],
+    'servo_b': [('dof_damping', SERVO_JOINTS, None, 1)],
+    'servo_I': [('dof_armature', SERVO_JOINTS, None, 1)],
+    'servo_f': [('dof_frictionloss', SERVO_JOINTS, None, 1)],
+    'servo_tmax': [
+        ('actuator_forcerange', None, 0, -1),
+        ('actuator_forcerange', None, 1, 1)
+    ],
+}
+
+
+def sample(params, np_random):
+    # Parameters given as [low, high] are drawn uniformly
+    params = params.copy()
+    for k, v in params.items():
+        if not isinstance(v, np.ndarray):
+            continue
+        params[k] = np_random.uniform(v[0], v[1])
+    return params
+
+
+def element_indices(model, field, names):
+    if names is None:
+        return slice(None)
+    if field.startswith('dof_'):
+        return np.array([model.joint(n).dofadr[0] for n in names])
+    element = getattr(model, field.split('_')[0])
+    return np.array([element(n).id for n in names])
+
+
+class Randomizer():
+    # Writes the values of an episode into a compiled model, so the model
+    # can be reused instead of compiling the XML again
+    def __init__(self, model, spec=DOMAIN_RANDOMIZATION):
+        self.model = model
+        self.writes = [
+            (k, getattr(model, field), element_indices(model, field, names),
+             column, scale)
+            for k, destinations in spec.items()
+            for field, names, column, scale in destinations
+        ]
+        self.floor = model.geom('floor')
+        self.body = model.body('body')
+        self.body_qposadr = model.joint('body').qposadr[0]
+
+    def __call__(self, params, data):
+        # data of the model is used as scratch space and has to be reset
+        for k, field, indices, column, scale in self.writes:
+            if column is None:
+                field[indices] = scale * params[k]
+            else:
+                field[indices, column] = scale * params[k]
+
+        self.floor.pos = [
+            params['floor_x'], params['floor_y'], params['floor_z']
+        ]
+        mujoco.mju_euler2Quat(self.floor.quat, np.deg2rad([
+            params['floor_roll'], params['floor_pitch'], params['floor_yaw']
+        ]), 'xyz')
+        # The floor is the only geom of the world body, whose bounding
+        # volume is in the world frame
+        floor_mat = np.zeros(9)
+        mujoco.mju_quat2Mat(floor_mat, self.floor.quat)
+        floor_mat = floor_mat.reshape(3, 3)
+        floor_aabb = self.model.geom_aabb[self.floor.id]
+        self.model.bvh_aabb[self.model.body_bvhadr[0]] = np.concatenate([
+            self.floor.pos + floor_mat @ floor_aabb[:3],
+            np.abs(floor_mat) @ floor_aabb[3:]
+        ])
+
+        # The free joint places the body at qpos0
+        self.body.pos = [
+            params['body_x'], params['body_y'], params['body_z']
+        ]
+        mujoco.mju_euler2Quat(self.body.quat, np.deg2rad([
+            params['body_roll'], params['body_pitch'], params['body_yaw']
+        ]), 'xyz')
+        qpos = slice(self.body_qposadr, self.body_qposadr + 7)
+        self.model.qpos0[qpos] = np.concatenate([
+            self.body.pos, self.body.quat
+        ])
+        self.model.qpos_spring[qpos] = self.model.qpos0[qpos]
+
+        # Constants the compiler derives from the values above
+        mujoco.mj_setConst(self.model, data)
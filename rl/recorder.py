@@ -0,0 +1,50 @@
+import os
+import numpy as np
+
+
+def load(path):
+    # Memory mapped, so fields of long recordings are read on access
+    return np.load(path, mmap_mode='r')
+
+
+class Recorder():
+    # States of an episode in a preallocated structured array, with one
+    # record every decimation steps. fields is a list of (name, size).
+    def __init__(self, fields, max_steps, decimation=1):
+        self.dtype = np.dtype([
+            (name, float) if size == 1 else (name, float, (size,))
+            for name, size in fields
+        ])
+        self.decimation = decimation
+        self.records = np.zeros(
+            -(-max_steps // decimation), dtype=self.dtype
+        )
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.step_count = 0
+
+    def next(self):
+        # Record to write the states of this step into, or None if the step
+        # is skipped
+        self.step_count += 1
+        if (self.step_count - 1) % self.decimation != 0:
+            return None
+        if self.count == len(self.records):
+            self.records = np.concatenate([
+                self.records, np.zeros(len(self.records), dtype=self.dtype)
+            ])
+        self.count += 1
+        return self.records[self.count - 1]
+
+    @property
+    def states(self):
+        # Recorded states so far, as a read only view indexed by field name
+        states = self.records[:self.count]
+        states.flags.writeable = False
+        return states
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.save(path, self.states)
@@ -0,0 +1,93 @@
+import importlib
+import numpy as np
+import mujoco
+
+# Offscreen GL backends. egl and osmesa render without a display. None uses
+# mujoco.GLContext, which follows the MUJOCO_GL environment variable.
+BACKENDS = [None, 'glfw', 'egl', 'osmesa']
+
+
+def gl_context(width, height, backend=None):
+    assert backend in BACKENDS, f'Unknown backend {backend}'
+    if backend is None:
+        return mujoco.GLContext(width, height)
+    module = importlib.import_module(f'mujoco.{backend}')
+    return module.GLContext(width, height)
+
+
+class Renderer():
+    # Scene and render context, created once per model and reused for every
+    # frame. Offscreen, it also owns a GL context and reads the frames into
+    # a preallocated pixel buffer. Otherwise, it draws into the current
+    # context, e.g. a window.
+    def __init__(
+        self, viewport, offscreen=False, backend=None, maxgeom=1000
+    ):
+        self.viewport = viewport
+        self.maxgeom = maxgeom
+        self.gl_context = None
+        if offscreen:
+            self.gl_context = gl_context(
+                viewport.width, viewport.height, backend=backend
+            )
+            self.pixels = np.empty(
+                (viewport.height, viewport.width, 3), dtype=np.uint8
+            )
+        self.model = None
+        self.scene = None
+        self.context = None
+        # Key of the terrain in the uploaded hfield
+        self.hfield_terrain = None
+
+    def make_current(self):
+        if self.gl_context is not None:
+            self.gl_context.make_current()
+
+    def set_model(self, model):
+        if model is self.model:
+            return
+        self.make_current()
+        if self.context is not None:
+            self.context.free()
+        self.model = model
+        self.scene = mujoco.MjvScene(model, maxgeom=self.maxgeom)
+        self.context = mujoco.MjrContext(
+            model, mujoco.mjtFontScale.mjFONTSCALE_100
+        )
+        self.hfield_terrain = None
+
+    def upload_hfield(self, hfield_id, hfield_terrain):
+        # The context has a copy of the hfield, which is uploaded again
+        # when the terrain changes
+        if self.hfield_terrain == hfield_terrain:
+            return
+        self.make_current()
+        mujoco.mjr_uploadHField(self.model, self.context, hfield_id)
+        self.hfield_terrain = hfield_terrain
+
+    def update_scene(self, data, opt, cam):
+        mujoco.mjv_updateScene(
+            self.model, data,
+            opt, None, cam, mujoco.mjtCatBit.mjCAT_ALL, self.scene
+        )
+        return self.scene
+
+    def render(self):
+        self.make_current()
+        mujoco.mjr_render(self.viewport, self.scene, self.context)
+
+    def read_pixels(self):
+        mujoco.mjr_readPixels(
+            rgb=self.pixels, depth=None,
+            viewport=self.viewport, con=self.context
+        )
+        # Frames are kept by the caller, so the buffer is not returned
+        return np.flip(self.pixels, axis=0).copy()
+
+    def free(self):
+        if self.context is not None:
+            self.context.free()
+            self.context = None
+        if self.gl_context is not None:
+            self.gl_context.free()
+            self.gl_context = None
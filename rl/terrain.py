@@ -0,0 +1,69 @@
+import os
+import threading
+import numpy as np
+
+NUM_MAPS = 64
+SEED = 0
+
+
+def bank_path(shape, num_maps=NUM_MAPS, seed=SEED):
+    return os.path.join(
+        'logs', 'terrain', f'bank_{shape[0]}x{shape[1]}_{num_maps}_{seed}.npy'
+    )
+
+
+def make_bank(shape, num_maps=NUM_MAPS, seed=SEED):
+    # Uniform height maps in [0, 1). Workers that race to create the same
+    # bank write identical content, and the file is replaced atomically.
+    path = bank_path(shape, num_maps=num_maps, seed=seed)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rng = np.random.default_rng(seed)
+        maps = rng.random((num_maps, *shape), dtype=np.float32)
+        tmp_path = (
+            f'{path}.{os.getpid()}_{threading.get_ident()}.tmp.npy'
+        )
+        np.save(tmp_path, maps)
+        os.replace(tmp_path, path)
+    return path
+
+
+class TerrainBank():
+    # Height maps memory mapped from disk, so the pages are shared by all
+    # workers. A terrain is identified by (map index, row offset, column
+    # offset, quarter turns, flip), and is the map cyclically shifted by the
+    # offsets, rotated and flipped.
+    def __init__(self, shape, num_maps=NUM_MAPS, seed=SEED):
+        assert shape[0] == shape[1], 'Rotations need a square map'
+        path = make_bank(shape, num_maps=num_maps, seed=seed)
+        self.maps = np.load(path, mmap_mode='r')
+
+    def sample(self, np_random):
+        num_maps, nrow, ncol = self.maps.shape
+        return (
+            int(np_random.integers(num_maps)),
+            int(np_random.integers(nrow)),
+            int(np_random.integers(ncol)),
+            int(np_random.integers(4)),
+            bool(np_random.integers(2))
+        )
+
+    def write(self, out, terrain_id, scale):
+        # Write the scaled terrain into out
+        index, row, col, k, flip = terrain_id
+        view = np.rot90(self.maps[index], k)
+        if flip:
+            view = view[:, ::-1]
+        # Cyclic shift as four block copies, without a temporary map
+        nrow, ncol = view.shape
+        for out_rows, rows in [
+            (slice(0, nrow - row), slice(row, nrow)),
+            (slice(nrow - row, nrow), slice(0, row))
+        ]:
+            for out_cols, cols in [
+                (slice(0, ncol - col), slice(col, ncol)),
+                (slice(ncol - col, ncol), slice(0, col))
+            ]:
+                np.multiply(
+                    view[rows, cols], scale, out=out[out_rows, out_cols]
+                )
@@ -0,0 +1,89 @@
+import os
+from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import gymnasium as gym
+from gymnasium.vector.utils import concatenate
+
+
+class ThreadedVectorEnv(gym.vector.SyncVectorEnv):
+    # SyncVectorEnv that steps its environments in a thread pool. mj_step
+    # releases the GIL, so the physics of one environment runs while the
+    # others are in Python, and one process can keep several cores busy.
+    def __init__(self, env_fns, num_threads=None, **kwargs):
+        super().__init__(env_fns, **kwargs)
+        self.pool = ThreadPoolExecutor(
+            num_threads if num_threads is not None else os.cpu_count()
+        )
+
+    def reset_wait(self, seed=None, options=None):
+        if seed is None:
+            seed = [None for _ in range(self.num_envs)]
+        if isinstance(seed, int):
+            seed = [seed + i for i in range(self.num_envs)]
+        assert len(seed) == self.num_envs
+
+        def reset(env, single_seed):
+            kwargs = {}
+            if single_seed is not None:
+                kwargs['seed'] = single_seed
+            if options is not None:
+                kwargs['options'] = options
+            return env.reset(**kwargs)
+
+        self._terminateds[:] = False
+        self._truncateds[:] = False
+        observations = []
+        infos = {}
+        for i, (observation, info) in enumerate(
+            self.pool.map(reset, self.envs, seed)
+        ):
+            observations.append(observation)
+            infos = self._add_info(infos, info, i)
+
+        self.observations = concatenate(
+            self.single_observation_space, observations, self.observations
+        )
+        return (
+            deepcopy(self.observations) if self.copy else self.observations,
+            infos
+        )
+
+    def step_wait(self):
+        def step(env, action):
+            observation, reward, terminated, truncated, info = env.step(
+                action
+            )
+            if terminated or truncated:
+                old_observation, old_info = observation, info
+                observation, info = env.reset()
+                info['final_observation'] = old_observation
+                info['final_info'] = old_info
+            return observation, reward, terminated, truncated, info
+
+        # Results are merged in order, as in SyncVectorEnv
+        observations, infos = [], {}
+        for i, (
+            observation,
+            self._rewards[i],
+            self._terminateds[i],
+            self._truncateds[i],
+            info
+        ) in enumerate(self.pool.map(step, self.envs, self._actions)):
+            observations.append(observation)
+            infos = self._add_info(infos, info, i)
+        self.observations = concatenate(
+            self.single_observation_space, observations, self.observations
+        )
+
+        return (
+            deepcopy(self.observations) if self.copy else self.observations,
+            np.copy(self._rewards),
+            np.copy(self._terminateds),
+            np.copy(self._truncateds),
+            infos,
+        )
+
+    def close_extras(self, **kwargs):
+        self.pool.shutdown()
+        super().close_extras(**kwargs)
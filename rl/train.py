@@ -79,6 +79,8 @@ class Trainer():
             self.learning_rate = self.checkpoint['learning_rate']
         self.num_async_vec_envs = 64
         self.num_sync_vec_envs = 16
+        self.num_threads = None  # per async env, None steps envs in turn
+        self.num_env_groups = 2  # of async envs, 1 steps all in lockstep
         self.num_steps = 50
         self.gamma = 0.99
         self.gae_lambda = 0.95
@@ -128,7 +130,8 @@ class Trainer():
         self.envs = ChunkedVectorEnv(
             self._make_env,
             self.num_async_vec_envs,
-            self.num_sync_vec_envs
+            self.num_sync_vec_envs,
+            num_threads=self.num_threads
         )
         if self.checkpoint is not None:
             self.envs.set_attr(
@@ -231,97 +234,76 @@ class Trainer():
         next_obs = torch.Tensor(next_obs).to(self.device)
         next_done = torch.zeros(self.num_envs).to(self.device)
 
+        # The async envs step in groups. The actions of a group are sent as
+        # soon as its observations arrive, so the policy and the bookkeeping
+        # run while the other groups are simulated.
+        groups = []
+        for chunk_indices in np.array_split(
+            np.arange(self.num_async_vec_envs), self.num_env_groups
+        ):
+            chunks = slice(chunk_indices[0], chunk_indices[-1] + 1)
+            groups.append((chunks, slice(
+                chunks.start * self.num_sync_vec_envs,
+                chunks.stop * self.num_sync_vec_envs
+            )))
+
+        def act(step, chunks, envs):
+            obs[step, envs] = next_obs[envs]
+            dones[step, envs] = next_done[envs]
+
+            # Action logic
+            with torch.no_grad():
+                action, logprob, _ = self.agent.get_action(next_obs[envs])
+                values[step, envs] = self.agent.get_value(
+                    next_obs[envs]
+                ).squeeze()
+            actions[step, envs] = action
+            logprobs[step, envs] = logprob
+
+            self.envs.step_async(action.cpu().numpy(), chunks=chunks)
+
         episode_rewards = {}
 
         for _ in range(self.num_updates):
+            for chunks, envs in groups:
+                act(0, chunks, envs)
+
             for step in range(0, self.num_steps):
-                obs[step] = next_obs
-                dones[step] = next_done
+                for chunks, envs in groups:
+                    # Execute the game and log data.
+                    (
+                        group_obs, reward, terminated, truncated, info
+                    ) = self.envs.step_wait(chunks=chunks)
+                    done = np.logical_or(terminated, truncated)
+                    rewards[step, envs] = torch.tensor(reward).to(self.device)
+                    next_obs[envs] = torch.Tensor(group_obs).to(self.device)
+                    next_done[envs] = torch.Tensor(done).to(self.device)
+
+                    # All groups are waited for before the update
+                    if step + 1 < self.num_steps:
+                        act(step + 1, chunks, envs)
+
+                    # Handle timeout by bootstrapping with value function
+                    # https://github.com/DLR-RM/stable-baselines3/issues/633
+                    for i, single_truncated in enumerate(truncated):
+                        if not single_truncated:
+                            continue
+
+                        terminated_obs = torch.Tensor(
+                            info['final_observation'][i]
+                        ).to(self.device)
+                        with torch.no_grad():
+                            terminated_value = self.agent.get_value(
+                                terminated_obs
+                            )[0]
+                        rewards[step, envs.start + i] += (
+                            self.gamma * terminated_value
+                        )
 
-                # Action logic
-                with torch.no_grad():
-                    action, logprob, _ = self.agent.get_action(next_obs)
-                    values[step] = self.agent.get_value(next_obs).squeeze()
-                actions[step] = action
-                logprobs[step] = logprob
-
-                # Execute the game and log data.
-                next_obs, reward, terminated, truncated, info = self.envs.step(
-                    action.cpu().numpy()
-                )
-                done = np.logical_or(terminated, truncated)
-                rewards[step] = torch.tensor(reward).to(self.device)
-                next_obs = torch.Tensor(next_obs).to(self.device)
-                next_done = torch.Tensor(done).to(self.device)
-
-                # Handle timeout by bootstrapping with value function
-                # https://github.com/DLR-RM/stable-baselines3/issues/633
-                for i, single_truncated in enumerate(truncated):
-                    if not single_truncated:
-                        continue
-
-                    terminated_obs = torch.Tensor(
-                        info['final_observation'][i]
-                    ).to(self.device)
-                    with torch.no_grad():
-                        terminated_value = self.agent.get_value(
-                            terminated_obs
-                        )[0]
-                    rewards[step, i] += self.gamma * terminated_value
+                    self._log_episode(info, episode_rewards)
 
                 self.global_step += 1 * self.num_envs
 
-                # Log episode
-                if not info or 'final_info' not in info:
-                    continue
-
-                for final_info in info['final_info']:
-                    if final_info is None:
-                        continue
-
-                    # Record reward values
-                    assert 'reward' in final_info
-                    for k, v in final_info['reward'].items():
-                        if k not in episode_rewards:
-                            episode_rewards[k] = [v]
-                        else:
-                            episode_rewards[k].append(v)
-
-                    # Update curriculum
-                    assert 'curriculum' in final_info
-                    design = final_info['curriculum']['design']
-
-                    cell = final_info['curriculum']['cell']
-                    cells = self.curriculum_cells[design]
-                    cell_index = cells.index(cell)
-
-                    scores = self.curriculum_scores[design]
-                    prev_score = scores[cell_index]
-                    score = final_info['curriculum']['score']
-                    score = (
-                        (1 - self.curriculum_score_alpha) * prev_score +
-                        self.curriculum_score_alpha * score
-                    )
-                    scores[cell_index] = score
-
-                    counts = self.curriculum_counts[design]
-                    counts[cell_index] += 1
-
-                    if score > self.curriculum_score_th:
-                        for dx, dy in [(0, 1), (1, 0,), (0, -1), (-1, 0)]:
-                            neighbour_cells = [  # with symmetry
-                                [cell[0] + dx, cell[1] + dy],
-                                [-(cell[0] + dx), cell[1] + dy],
-                                [cell[0] + dx, -(cell[1] + dy)],
-                                [-(cell[0] + dx), -(cell[1] + dy)],
-                            ]
-                            for neighbour_cell in neighbour_cells:
-                                if neighbour_cell not in cells:
-                                    cells.append(neighbour_cell)
-                                    scores.append(0)
-                                    counts.append(0)
-                        # TODO: Try more immediate curriculum update
-
             # Bootstrap value if not done
             with torch.no_grad():
                 next_value = self.agent.get_value(next_obs).squeeze()
@@ -426,6 +408,57 @@ class Trainer():
 
         self.envs.close()
 
+    def _log_episode(self, info, episode_rewards):
+        if not info or 'final_info' not in info:
+            return
+
+        for final_info in info['final_info']:
+            if final_info is None:
+                continue
+
+            # Record reward values
+            assert 'reward' in final_info
+            for k, v in final_info['reward'].items():
+                if k not in episode_rewards:
+                    episode_rewards[k] = [v]
+                else:
+                    episode_rewards[k].append(v)
+
+            # Update curriculum
+            assert 'curriculum' in final_info
+            design = final_info['curriculum']['design']
+
+            cell = final_info['curriculum']['cell']
+            cells = self.curriculum_cells[design]
+            cell_index = cells.index(cell)
+
+            scores = self.curriculum_scores[design]
+            prev_score = scores[cell_index]
+            score = final_info['curriculum']['score']
+            score = (
+                (1 - self.curriculum_score_alpha) * prev_score +
+                self.curriculum_score_alpha * score
+            )
+            scores[cell_index] = score
+
+            counts = self.curriculum_counts[design]
+            counts[cell_index] += 1
+
+            if score > self.curriculum_score_th:
+                for dx, dy in [(0, 1), (1, 0,), (0, -1), (-1, 0)]:
+                    neighbour_cells = [  # with symmetry
+                        [cell[0] + dx, cell[1] + dy],
+                        [-(cell[0] + dx), cell[1] + dy],
+                        [cell[0] + dx, -(cell[1] + dy)],
+                        [-(cell[0] + dx), -(cell[1] + dy)],
+                    ]
+                    for neighbour_cell in neighbour_cells:
+                        if neighbour_cell not in cells:
+                            cells.append(neighbour_cell)
+                            scores.append(0)
+                            counts.append(0)
+                # TODO: Try more immediate curriculum update
+
     def _make_env(self):
         env = Env()
         # Normalizing reward is important!